@@ -0,0 +1,286 @@
+"""
+Admission control in front of the model
+
+Three layers keep a traffic spike from turning into a wall of timeouts:
+
+* a token bucket per client caps how fast any one client can start model
+  calls (cache hits and coalesced requests are not charged);
+* an adaptive limiter bounds concurrent model calls, queues a bounded
+  number of callers for at most ADMISSION_MAX_WAIT seconds and rejects the
+  rest. The limit grows while upstream latency stays near its baseline and
+  shrinks when latency climbs or the upstream throttles us;
+* throttled calls are retried with jittered exponential backoff, without
+  holding a slot while they wait.
+
+Rejections raise Overloaded, which main.py turns into 429 or 503 with a
+Retry-After header.
+"""
+
+import asyncio
+import logging
+import math
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable
+
+from constants import (ADMISSION_LATENCY_TOLERANCE, ADMISSION_MAX_WAIT, ADMISSION_MIN_CONCURRENCY,
+                       ADMISSION_QUEUE_SIZE, CLIENT_BURST, CLIENT_RATE, MODEL_CONCURRENCY, MODEL_RETRIES,
+                       MODEL_RETRY_BASE_DELAY, MODEL_RETRY_MAX_DELAY)
+
+logger = logging.getLogger(__name__)
+
+# Distinct clients tracked before the least recently seen are forgotten
+MAX_TRACKED_CLIENTS = 10000
+
+
+class Overloaded(Exception):
+    """The request cannot be admitted now; retry_after is a hint in seconds"""
+
+    status_code = 503
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class RateLimited(Overloaded):
+    status_code = 429
+
+
+class UpstreamThrottled(Exception):
+    """Raised by model backends when the upstream rejects a call for load reasons"""
+
+
+def is_throttled(error: Exception) -> bool:
+    """True for upstream rate limiting or overload (429/503), including google.api_core errors"""
+    if isinstance(error, UpstreamThrottled):
+        return True
+    return getattr(error, "code", None) in (429, 503)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, cost: float = 1.0) -> float:
+        """Take cost tokens; returns 0 on success, else seconds until enough tokens accrue"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        cost = min(cost, self.burst)
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+
+class ClientRateLimiter:
+    """One token bucket per client ID"""
+
+    def __init__(self, rate: float = CLIENT_RATE, burst: float = CLIENT_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+        self.rejected = 0
+
+    def admit(self, client_id: str, cost: float = 1.0):
+        """Charge a request to its client, raising RateLimited when the bucket is empty"""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            bucket = self._buckets.pop(client_id, None) or TokenBucket(self.rate, self.burst)
+            self._buckets[client_id] = bucket
+            if len(self._buckets) > MAX_TRACKED_CLIENTS:
+                self._buckets.popitem(last=False)
+            wait = bucket.take(cost)
+            if wait:
+                self.rejected += 1
+        if wait:
+            raise RateLimited(f"Too many requests from client '{client_id}'", retry_after=wait)
+
+
+# Smoothing for the recent latency and for the long-horizon baseline
+LATENCY_SMOOTHING = 0.2
+BASELINE_SMOOTHING = 0.005
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit with a bounded wait queue. The limit follows an
+    AIMD rule evaluated once per limit's worth of completed calls: +1 when
+    the smoothed latency stays within the tolerance factor of a slow-moving
+    baseline, x0.9 when it exceeds it, and x0.5 at once when the upstream
+    throttles. Comparing averages rather than single samples keeps normal
+    model latency variance from shrinking the limit.
+    """
+
+    def __init__(self, initial: int = MODEL_CONCURRENCY, min_limit: int = ADMISSION_MIN_CONCURRENCY,
+                 max_limit: int = MODEL_CONCURRENCY, queue_size: int = ADMISSION_QUEUE_SIZE,
+                 max_wait: float = ADMISSION_MAX_WAIT, latency_tolerance: float = ADMISSION_LATENCY_TOLERANCE):
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, min_limit)
+        self.limit = float(min(max(initial, min_limit), self.max_limit))
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self._waiters = deque()
+        self._baseline = None
+        self._latency = None
+        self._window = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.throttled = 0
+
+    def _retry_after(self) -> float:
+        latency = self._latency or 1.0
+        return latency * (len(self._waiters) + 1) / max(1.0, self.limit)
+
+    async def acquire(self):
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.queue_size:
+            self.rejected += 1
+            raise Overloaded("Model queue is full", retry_after=self._retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.max_wait)
+        except asyncio.TimeoutError:
+            self._discard(waiter)
+            self.timed_out += 1
+            raise Overloaded(f"Waited more than {self.max_wait:g}s for the model", retry_after=self._retry_after())
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the caller went away
+                self.in_flight -= 1
+                self._wake()
+            else:
+                self._discard(waiter)
+            raise
+        self.admitted += 1
+
+    def _discard(self, waiter):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def release(self, latency: float = None, throttled: bool = False):
+        self.in_flight -= 1
+        if throttled:
+            self.throttled += 1
+            self.limit = max(self.min_limit, self.limit * 0.5)
+        elif latency is not None:
+            # Floor so an instant failure cannot pin the baseline at zero
+            latency = max(latency, 0.001)
+            if self._latency is None:
+                self._latency = self._baseline = latency
+            self._latency += LATENCY_SMOOTHING * (latency - self._latency)
+            # The baseline follows slowly, so a lasting shift is eventually accepted
+            self._baseline += BASELINE_SMOOTHING * (latency - self._baseline)
+            self._window += 1
+            if self._window >= self.limit:
+                self._window = 0
+                if self._latency > self._baseline * self.latency_tolerance:
+                    self.limit = max(self.min_limit, self.limit * 0.9)
+                else:
+                    self.limit = min(self.max_limit, self.limit + 1)
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold a slot for one model call, feeding its latency back into the limit"""
+        await self.acquire()
+        start = time.perf_counter()
+        throttled = False
+        try:
+            yield
+        except Exception as e:
+            throttled = is_throttled(e)
+            raise
+        finally:
+            self.release(time.perf_counter() - start, throttled)
+
+    def release_when_done(self, future: asyncio.Future):
+        """
+        Hold an acquired slot until future finishes, even when its caller
+        stops waiting: the model thread keeps running after a disconnect,
+        so the slot must keep counting it.
+        """
+        start = time.perf_counter()
+
+        def done(_):
+            error = None if future.cancelled() else future.exception()
+            self.release(time.perf_counter() - start, error is not None and is_throttled(error))
+
+        future.add_done_callback(done)
+
+    def stats(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "throttled": self.throttled,
+            "latency_ms": round(self._latency * 1000, 1) if self._latency is not None else None,
+            "baseline_ms": round(self._baseline * 1000, 1) if self._baseline is not None else None,
+        }
+
+
+class AdmissionController:
+    def __init__(self, limiter: AdaptiveLimiter = None, clients: ClientRateLimiter = None,
+                 retries: int = MODEL_RETRIES, base_delay: float = MODEL_RETRY_BASE_DELAY,
+                 max_delay: float = MODEL_RETRY_MAX_DELAY):
+        self.limiter = limiter or AdaptiveLimiter()
+        self.clients = clients or ClientRateLimiter()
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retried = 0
+
+    def admit_client(self, client_id: str, cost: float = 1.0):
+        self.clients.admit(client_id, cost)
+
+    async def call(self, fn: Callable[[], Awaitable]):
+        """Run fn() under the concurrency limit, retrying upstream throttling with backoff"""
+        for attempt in range(self.retries + 1):
+            try:
+                async with self.limiter.slot():
+                    return await fn()
+            except Exception as e:
+                if not is_throttled(e):
+                    raise
+                if attempt == self.retries:
+                    raise Overloaded("The model is throttling requests", retry_after=self.max_delay) from e
+                # Full jitter keeps retries from many requests from landing together
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                self.retried += 1
+                logger.warning("Model call throttled (attempt %d), retrying in %.2fs", attempt + 1, delay)
+                await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        return {**self.limiter.stats(), "retried": self.retried, "client_rejected": self.clients.rejected}
+
+
+model_admission = AdmissionController()
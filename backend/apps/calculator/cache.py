@@ -0,0 +1,258 @@
+"""
+Content-addressed cache for analyze_image results
+"""
+
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from cachetools import TTLCache
+from PIL import Image
+
+from apps.calculator.prompts import TEMPLATE_VERSION
+from constants import RESULT_CACHE_MAX_BYTES, RESULT_CACHE_PATH, RESULT_CACHE_PERCEPTUAL, RESULT_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+# Perceptual hashing compares a small grayscale thumbnail quantized to a few
+# levels, so a stray pixel or a different PNG encoder still lands on the same key
+PERCEPTUAL_SIZE = 64
+PERCEPTUAL_LEVELS = 8
+
+
+def image_hash(image: Image.Image, perceptual: bool = RESULT_CACHE_PERCEPTUAL) -> str:
+    """Hash the decoded pixels of a flattened RGB canvas"""
+    if perceptual:
+        thumb = image.convert("L").resize((PERCEPTUAL_SIZE, PERCEPTUAL_SIZE), Image.Resampling.BOX)
+        step = 256 // PERCEPTUAL_LEVELS
+        data = thumb.point(lambda value: value // step).tobytes()
+        return "p:" + hashlib.sha256(data).hexdigest()
+    digest = hashlib.sha256(f"{image.mode}{image.size}".encode())
+    digest.update(image.tobytes())
+    return "x:" + digest.hexdigest()
+
+
+def make_key(img_hash: str, dict_of_vars: dict, mode: str, detailed_steps: bool) -> str:
+    """Combine the image hash with every other input that changes the answer, including the prompt version"""
+    vars_str = json.dumps(dict_of_vars, sort_keys=True, ensure_ascii=False, default=str)
+    raw = f"{TEMPLATE_VERSION}|{img_hash}|{vars_str}|{getattr(mode, 'value', mode)}|{bool(detailed_steps)}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def make_answers_key(img_hash: str, mode: str) -> str:
+    """Key for the latest model answers for a canvas, whatever the variables were"""
+    raw = f"answers|{TEMPLATE_VERSION}|{img_hash}|{getattr(mode, 'value', mode)}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+# Seconds between accessed_at updates for a row that keeps being read
+ACCESS_RESOLUTION = 60
+
+# Eviction frees space down to this share of the byte budget
+EVICT_TO = 0.9
+
+
+def _encode(value) -> str:
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+class DiskCache:
+    """
+    SQLite-backed store with the same TTL and byte budget as the memory
+    tier. Several worker processes may share the file, so the byte total
+    lives in the database and is updated in each write transaction rather
+    than recomputed. Calls block on SQLite; use ResultCache.aget/aset from
+    the event loop.
+    """
+
+    def __init__(self, path: str, ttl: int, max_bytes: int):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Safe under WAL and avoids an fsync per write when several workers share the file
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        # Files written before the total was tracked are summed once
+        self._conn.execute(
+            "INSERT OR IGNORE INTO meta SELECT 'bytes', COALESCE(SUM(size), 0) FROM results"
+        )
+        self._conn.commit()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, accessed_at FROM results WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            # Recency only orders eviction, so a coarse timestamp spares most reads a write
+            if now - row[1] > ACCESS_RESOLUTION:
+                self._conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+        return json.loads(row[0])
+
+    def set(self, key: str, value):
+        text = _encode(value)
+        now = time.time()
+        with self._lock:
+            # Take the write lock up front so the size delta and the row change agree
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                old = self._conn.execute("SELECT size FROM results WHERE key = ?", (key,)).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                    (key, text, len(text), now + self.ttl, now),
+                )
+                total = self._add_bytes(len(text) - (old[0] if old else 0))
+                if total > self.max_bytes:
+                    self._evict(now, total)
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+            self._conn.execute("UPDATE meta SET value = 0 WHERE name = 'bytes'")
+            self._conn.commit()
+
+    def _add_bytes(self, delta: int) -> int:
+        self._conn.execute("UPDATE meta SET value = value + ? WHERE name = 'bytes'", (delta,))
+        return self._conn.execute("SELECT value FROM meta WHERE name = 'bytes'").fetchone()[0]
+
+    def _evict(self, now: float, total: int):
+        # Expired rows go first, then least recently used ones, down to a low
+        # watermark so the next few writes do not each evict again
+        excess = total - int(self.max_bytes * EVICT_TO)
+        freed = 0
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM results ORDER BY expires_at > ?, accessed_at", (now,)
+        ).fetchall():
+            if freed >= excess:
+                break
+            self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            freed += size
+        self._add_bytes(-freed)
+
+
+class ResultCache:
+    """
+    Two-tier result cache: an in-process LRU/TTL dict bounded by an
+    approximate byte budget, optionally backed by a SQLite file that
+    survives restarts.
+    """
+
+    def __init__(self, ttl: int = RESULT_CACHE_TTL, max_bytes: int = RESULT_CACHE_MAX_BYTES,
+                 path: Optional[str] = RESULT_CACHE_PATH):
+        self._lock = threading.Lock()
+        self._memory = TTLCache(maxsize=max_bytes, ttl=ttl, getsizeof=lambda entry: entry[0])
+        self._disk = None
+        if path:
+            # An unusable file must not keep the app from starting; the memory tier still works
+            try:
+                self._disk = DiskCache(path, ttl, max_bytes)
+            except sqlite3.Error:
+                logger.warning("Result cache file %s could not be opened; caching in memory only", path,
+                               exc_info=True)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key: str, track: bool = True):
+        """
+        Return a copy of the cached value; track=False leaves the hit/miss
+        counters alone. A failing disk lookup counts as a miss.
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self.hits += track
+        if entry is not None:
+            return copy.deepcopy(entry[1])
+        value = None
+        if self._disk is not None:
+            try:
+                value = self._disk.get(key)
+            except (sqlite3.Error, ValueError):
+                logger.warning("Result cache disk lookup failed", exc_info=True)
+        with self._lock:
+            if value is None:
+                self.misses += track
+                return None
+            self.hits += track
+            self.disk_hits += track
+        self._remember(key, value)
+        return copy.deepcopy(value)
+
+    def set(self, key: str, value):
+        """Store a value; a failing disk write is logged and the memory tier still keeps it"""
+        # Empty answers are parse failures; caching them would pin the failure
+        if not value:
+            return
+        self._remember(key, copy.deepcopy(value))
+        if self._disk is not None:
+            try:
+                self._disk.set(key, value)
+            except sqlite3.Error:
+                logger.warning("Result cache disk write failed", exc_info=True)
+
+    async def aget(self, key: str, track: bool = True):
+        """get() for the event loop: memory hits answer inline, disk lookups run in a thread"""
+        if self._disk is not None:
+            with self._lock:
+                cached = key in self._memory
+            if not cached:
+                return await asyncio.to_thread(self.get, key, track)
+        return self.get(key, track)
+
+    async def aset(self, key: str, value):
+        """set() for the event loop; the disk write runs in a thread"""
+        if self._disk is not None:
+            return await asyncio.to_thread(self.set, key, value)
+        self.set(key, value)
+
+    def _remember(self, key: str, value):
+        size = len(_encode(value))
+        with self._lock:
+            if size <= self._memory.maxsize:
+                self._memory[key] = (size, value)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self._disk is not None:
+            self._disk.clear()
+        with self._lock:
+            self.hits = self.disk_hits = self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._memory),
+                "bytes": self._memory.currsize,
+                "max_bytes": self._memory.maxsize,
+                "persistent": self._disk is not None,
+            }
+
+
+result_cache = ResultCache()
@@ -0,0 +1,95 @@
+"""
+Picks the formulas worth putting in a prompt
+
+A TF-IDF index over each mode's formulas (names, explanations and the
+LaTeX itself) is built once. Each request is scored against it using the
+names of the user's variables and the expressions the model previously
+read from the same canvas. The best matches are kept up to a top-k and an
+approximate token budget. Without any signal the mode's formulas are used
+in library order, still within the budget.
+"""
+
+import json
+import math
+from collections import Counter, defaultdict
+
+from constants import FORMULA_TOKEN_BUDGET, FORMULA_TOP_K
+from formula_library import MODE_TO_FORMULAS, normalize
+
+# Rough prompt-token estimate for budget purposes
+CHARS_PER_TOKEN = 4
+
+# Words too common in the library to say anything about relevance
+_STOPWORDS = {"a", "an", "the", "of", "and", "or", "to", "in", "for", "with", "by", "is", "as", "on", "from", "that"}
+
+
+def _terms(text: str) -> list:
+    return [word for word in normalize(text).split() if word not in _STOPWORDS]
+
+
+class FormulaRetriever:
+    def __init__(self, mode_to_formulas: dict):
+        self.entries = {}
+        self.postings = {}
+        self.norms = {}
+        for mode, formulas in mode_to_formulas.items():
+            entries = []
+            documents = []
+            for key, data in formulas.items():
+                public = {"name": data["name"], "formula": data["formula"], "explanation": data["explanation"]}
+                fragment = f"{json.dumps(key, ensure_ascii=False)}: {json.dumps(public, ensure_ascii=False)}"
+                entries.append((key, fragment, len(fragment) // CHARS_PER_TOKEN + 1))
+                text = " ".join([key, data["name"], *data.get("aliases", []), data["explanation"], data["formula"]])
+                documents.append(Counter(_terms(text)))
+
+            document_frequency = Counter(term for document in documents for term in document)
+            postings = defaultdict(list)
+            norms = []
+            for index, document in enumerate(documents):
+                squared = 0.0
+                for term, count in document.items():
+                    weight = (1 + math.log(count)) * math.log(1 + len(documents) / document_frequency[term])
+                    postings[term].append((index, weight))
+                    squared += weight * weight
+                norms.append(math.sqrt(squared) or 1.0)
+            self.entries[mode] = entries
+            self.postings[mode] = dict(postings)
+            self.norms[mode] = norms
+
+    def rank(self, mode: str, query: str) -> list:
+        """Indexes of the mode's formulas that share terms with the query, best first"""
+        postings = self.postings.get(mode, {})
+        scores = defaultdict(float)
+        for term, count in Counter(_terms(query)).items():
+            for index, weight in postings.get(term, ()):
+                scores[index] += weight * (1 + math.log(count))
+        norms = self.norms.get(mode, [])
+        return sorted(scores, key=lambda index: (-scores[index] / norms[index], index))
+
+    def select(self, mode: str, query: str = "", top_k: int = FORMULA_TOP_K,
+               token_budget: int = FORMULA_TOKEN_BUDGET) -> str:
+        """Return the JSON object of formulas to embed in the prompt"""
+        entries = self.entries.get(mode, [])
+        order = self.rank(mode, query) if query else []
+        if not order:
+            order = range(len(entries))
+        fragments = []
+        tokens = 0
+        for index in order:
+            if len(fragments) >= top_k:
+                break
+            _, fragment, cost = entries[index]
+            if fragments and tokens + cost > token_budget:
+                continue
+            fragments.append(fragment)
+            tokens += cost
+        return "{" + ", ".join(fragments) + "}"
+
+
+formula_retriever = FormulaRetriever(MODE_TO_FORMULAS)
+
+
+def select_formulas(mode: str, dict_of_vars: dict = None, hint: str = "") -> str:
+    """Relevant formulas for a request, as the JSON text that goes into the prompt"""
+    query = " ".join([*(dict_of_vars or {}).keys(), hint or ""]).strip()
+    return formula_retriever.select(getattr(mode, "value", mode), query)
@@ -0,0 +1,304 @@
+"""
+Local fast path for simple answers
+
+When a canvas has been solved before, the model's answers for it are
+remembered per image. A later request for the same canvas with different
+variables can often be answered here: plain arithmetic and expressions
+over dict_of_vars are re-evaluated with a restricted AST evaluator, echoed
+linear equations are re-solved, and variable assignments are replayed.
+Anything else falls back to the model.
+"""
+
+import ast
+import math
+import operator
+import re
+import threading
+from typing import Optional
+
+_BIN_OPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Pow: operator.pow,
+    ast.Mod: operator.mod,
+}
+
+_UNARY_OPS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+_FUNCTIONS = {
+    "sqrt": math.sqrt,
+    "sin": math.sin,
+    "cos": math.cos,
+    "tan": math.tan,
+    "log": math.log10,
+    "ln": math.log,
+    "abs": abs,
+}
+
+_CONSTANTS = {
+    "pi": math.pi,
+    "e": math.e,
+}
+
+MAX_EXPONENT = 100
+MAX_EXPR_LENGTH = 200
+# Results, and the estimated size of a power before it is computed, are
+# capped at this many decimal digits so nested powers cannot run for minutes
+MAX_RESULT_DIGITS = 300
+
+_LATEX_REPLACEMENTS = [
+    (r"\left", ""),
+    (r"\right", ""),
+    (r"\times", "*"),
+    (r"\cdot", "*"),
+    (r"\div", "/"),
+    (r"\pi", " pi "),
+    ("×", "*"),
+    ("÷", "/"),
+    ("−", "-"),
+    ("π", " pi "),
+    ("^", "**"),
+]
+
+_FRAC = re.compile(r"\\frac\{([^{}]*)\}\{([^{}]*)\}")
+_SQRT = re.compile(r"\\sqrt\{([^{}]*)\}")
+_FUNC = re.compile(r"\\(sin|cos|tan|log|ln)\b")
+_IMPLICIT_MUL = re.compile(r"(?<=[\d)])\s*(?=[A-Za-z(])")
+_IDENTIFIER = re.compile(r"[A-Za-z_]\w*")
+
+
+class UnsupportedExpression(ValueError):
+    pass
+
+
+def latex_to_python(expr: str) -> str:
+    """Translate the simple LaTeX the model writes into a Python expression"""
+    text = expr.strip().strip("$").strip()
+    for _ in range(4):
+        text = _FRAC.sub(r"((\1)/(\2))", text)
+        text = _SQRT.sub(r"sqrt(\1)", text)
+    text = _FUNC.sub(r"\1", text)
+    for latex, python in _LATEX_REPLACEMENTS:
+        text = text.replace(latex, python)
+    if "\\" in text:
+        raise UnsupportedExpression(f"Unsupported LaTeX in '{expr}'")
+    text = text.replace("{", "(").replace("}", ")")
+    # 2x -> 2*x, 3(x+1) -> 3*(x+1), (a)(b) -> (a)*(b); letters followed by
+    # digits are left alone so names like x1 survive
+    text = _IMPLICIT_MUL.sub("*", text).replace(")(", ")*(")
+    return text
+
+
+def _eval_node(node, variables: dict):
+    if isinstance(node, ast.Expression):
+        return _eval_node(node.body, variables)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        return node.value
+    if isinstance(node, ast.BinOp) and type(node.op) in _BIN_OPS:
+        left = _eval_node(node.left, variables)
+        right = _eval_node(node.right, variables)
+        if isinstance(node.op, ast.Pow):
+            if abs(right) > MAX_EXPONENT:
+                raise UnsupportedExpression("Exponent too large")
+            if left and abs(right) * math.log10(abs(left)) > MAX_RESULT_DIGITS:
+                raise UnsupportedExpression("Result too large")
+        return _BIN_OPS[type(node.op)](left, right)
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPS:
+        return _UNARY_OPS[type(node.op)](_eval_node(node.operand, variables))
+    if isinstance(node, ast.Name):
+        if node.id in variables:
+            return _number(variables[node.id])
+        if node.id in _CONSTANTS:
+            return _CONSTANTS[node.id]
+        raise UnsupportedExpression(f"Unknown variable '{node.id}'")
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in _FUNCTIONS
+            and len(node.args) == 1 and not node.keywords):
+        return _FUNCTIONS[node.func.id](_eval_node(node.args[0], variables))
+    raise UnsupportedExpression(f"Unsupported syntax: {type(node).__name__}")
+
+
+def _number(value):
+    if isinstance(value, bool):
+        raise UnsupportedExpression("Boolean is not a number")
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise UnsupportedExpression(f"Variable value '{value}' is not a number") from None
+
+
+def _tidy(value):
+    """Present results the way the model does: 14 rather than 14.000000000000002"""
+    if isinstance(value, complex):
+        raise UnsupportedExpression("Complex result")
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            raise UnsupportedExpression("Non-finite result")
+        value = round(value, 10)
+        if value.is_integer():
+            return int(value)
+    elif isinstance(value, int) and value and math.log10(abs(value)) > MAX_RESULT_DIGITS:
+        raise UnsupportedExpression("Result too large")
+    return value
+
+
+def evaluate(expr: str, variables: dict = None):
+    """Evaluate an arithmetic expression, substituting variables"""
+    if len(expr) > MAX_EXPR_LENGTH:
+        raise UnsupportedExpression("Expression too long")
+    source = latex_to_python(expr)
+    try:
+        tree = ast.parse(source, mode="eval")
+    except SyntaxError:
+        raise UnsupportedExpression(f"Cannot parse '{expr}'") from None
+    try:
+        return _tidy(_eval_node(tree, variables or {}))
+    except (ArithmeticError, ValueError) as e:
+        if isinstance(e, UnsupportedExpression):
+            raise
+        raise UnsupportedExpression(str(e)) from None
+
+
+def solve_linear(equation: str, variables: dict = None):
+    """Solve 'lhs = rhs' for its single unknown, if it is linear in it"""
+    variables = variables or {}
+    lhs, sep, rhs = equation.partition("=")
+    if not sep or "=" in rhs:
+        raise UnsupportedExpression("Not a single equation")
+    names = set(_IDENTIFIER.findall(latex_to_python(lhs) + " " + latex_to_python(rhs)))
+    unknowns = sorted(names - set(variables) - set(_CONSTANTS) - set(_FUNCTIONS))
+    if len(unknowns) != 1:
+        raise UnsupportedExpression("Equation must have exactly one unknown")
+    unknown = unknowns[0]
+
+    def residual(value):
+        scope = {**variables, unknown: value}
+        return evaluate(lhs, scope) - evaluate(rhs, scope)
+
+    f0, f1, f2 = residual(0), residual(1), residual(2)
+    slope = f1 - f0
+    if slope == 0 or not math.isclose(f2 - f1, slope, rel_tol=1e-9, abs_tol=1e-9):
+        raise UnsupportedExpression("Equation is not linear in the unknown")
+    return unknown, _tidy(-f0 / slope)
+
+
+def _names(expr: str) -> set:
+    return set(_IDENTIFIER.findall(latex_to_python(expr)))
+
+
+def _replayable(value, prior_result, changed: set, names: set) -> bool:
+    """
+    True when value, computed from the expression under the previous
+    variables, matches the model's numeric result, and the expression
+    mentions every variable that changed. Otherwise the model may have
+    substituted a value into expr, or read a symbol we evaluate differently.
+    """
+    try:
+        prior_result = _number(prior_result)
+    except UnsupportedExpression:
+        return False
+    try:
+        if not math.isclose(value, prior_result, rel_tol=1e-9, abs_tol=1e-9):
+            return False
+    except OverflowError:
+        # An integer beyond the float range, e.g. a huge result the model wrote out
+        raise UnsupportedExpression("Result too large") from None
+    return changed <= names
+
+
+def solve_locally(previous: list, previous_vars: dict, dict_of_vars: dict,
+                  detailed_steps: bool = False) -> Optional[list]:
+    """
+    Re-answer a canvas from the answers the model gave for it before, when
+    it was solved with previous_vars. Returns None when any part needs the model.
+    """
+    if not previous:
+        return None
+    changed = {
+        name for name in set(previous_vars) | set(dict_of_vars)
+        if previous_vars.get(name) != dict_of_vars.get(name)
+    }
+    assigned = {prior.get("expr") for prior in previous if prior.get("assign")}
+    # A solved variable may have depended on other variables; only replay it
+    # if none of those changed (the frontend adds the assigned names itself)
+    vars_unchanged = all(
+        dict_of_vars.get(name) == value
+        for name, value in previous_vars.items()
+        if name not in assigned
+    )
+    answers = []
+    for prior in previous:
+        expr = prior.get("expr")
+        if not isinstance(expr, str):
+            return None
+        try:
+            if prior.get("assign") and _IDENTIFIER.fullmatch(expr) and vars_unchanged:
+                # Assignments and solved variables do not depend on dict_of_vars
+                result = _tidy(_number(prior.get("result")))
+                steps = [f"Assign {expr} = {result}"]
+            elif prior.get("assign") and "=" in expr:
+                # The model echoed the equation it solved; re-solve with the current variables
+                _, before = solve_linear(expr, previous_vars)
+                if not _replayable(before, prior.get("result"), changed, _names(expr)):
+                    return None
+                expr, result = solve_linear(expr, dict_of_vars)
+                steps = [f"Solve {prior['expr']} for {expr}", f"{expr} = {result}"]
+            elif prior.get("assign") or "=" in expr:
+                return None
+            else:
+                if not _replayable(evaluate(expr, previous_vars), prior.get("result"), changed, _names(expr)):
+                    return None
+                result = evaluate(expr, dict_of_vars)
+                used = sorted(_names(expr) & set(dict_of_vars))
+                steps = [f"Substitute {name} = {dict_of_vars[name]}" for name in used]
+                steps.append(f"Evaluate {expr} = {result}")
+        except UnsupportedExpression:
+            return None
+        answer = {"expr": expr, "result": result, "assign": bool(prior.get("assign"))}
+        if detailed_steps:
+            answer["steps"] = steps
+            answer["formulas_used"] = []
+        answers.append(answer)
+    return answers
+
+
+class TierStats:
+    """Per-tier hit counts and latency for the tiered solver"""
+
+    TIERS = ("cache", "local", "coalesced", "model")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._hits = {tier: 0 for tier in self.TIERS}
+            self._seconds = {tier: 0.0 for tier in self.TIERS}
+
+    def record(self, tier: str, seconds: float):
+        with self._lock:
+            self._hits[tier] += 1
+            self._seconds[tier] += seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            total = sum(self._hits.values())
+            return {
+                tier: {
+                    "hits": self._hits[tier],
+                    "hit_rate": self._hits[tier] / total if total else 0.0,
+                    "avg_ms": self._seconds[tier] / self._hits[tier] * 1000 if self._hits[tier] else 0.0,
+                }
+                for tier in self.TIERS
+            }
+
+
+tier_stats = TierStats()
+
@@ -0,0 +1,248 @@
+"""
+Pooled model clients shared across requests
+
+The pool is started from the FastAPI lifespan hook and hands out clients
+with a per-client concurrency limit. Backends are pluggable so that
+benchmarks and tests can run against a local fake with no network.
+"""
+
+import logging
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Union
+
+from apps.calculator.admission import UpstreamThrottled
+from apps.calculator.response_parser import RESPONSE_SCHEMA
+from constants import (GEMINI_API_KEY, MODEL_BACKEND, MODEL_CLIENT_CONCURRENCY, MODEL_NAME, MODEL_POOL_SIZE,
+                       MODEL_STRUCTURED_OUTPUT)
+
+logger = logging.getLogger(__name__)
+
+
+class GeminiBackend:
+    """Creates google.generativeai clients; each keeps its gRPC channel between calls"""
+
+    def __init__(self, model_name: str = MODEL_NAME, api_key: str = GEMINI_API_KEY,
+                 structured_output: bool = MODEL_STRUCTURED_OUTPUT):
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        self._genai = genai
+        self.model_name = model_name
+        self.generation_config = None
+        if structured_output:
+            self.generation_config = {"response_mime_type": "application/json", "response_schema": RESPONSE_SCHEMA}
+
+    def create_client(self):
+        return self._genai.GenerativeModel(model_name=self.model_name, generation_config=self.generation_config)
+
+    def warmup(self, client):
+        """Open the client's channel and check the key with a call that generates nothing"""
+        client.count_tokens("warmup")
+
+    def close_client(self, client):
+        pass
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeModel:
+    """Stand-in for GenerativeModel that sleeps and returns a canned answer"""
+
+    def __init__(self, backend: "FakeBackend"):
+        self.backend = backend
+        self.calls = 0
+
+    def generate_content(self, contents, stream: bool = False, **kwargs):
+        self.calls += 1
+        self.backend.calls += 1
+        text = self.backend.reply(contents)
+        latency = self.backend.sample_latency()
+        if stream:
+            return self._stream(text, latency)
+        with self.backend.in_flight():
+            if latency:
+                time.sleep(latency)
+            return FakeResponse(text)
+
+    def _stream(self, text: str, latency: float):
+        """Yield the canned answer in small chunks spread over the latency"""
+        size = self.backend.chunk_size
+        chunks = [text[i:i + size] for i in range(0, len(text), size)] or [""]
+        with self.backend.in_flight():
+            for chunk in chunks:
+                if latency:
+                    time.sleep(latency / len(chunks))
+                yield FakeResponse(chunk)
+
+
+class FakeBackend:
+    """
+    Local backend for benchmarks and tests. latency is either seconds or
+    a function returning a sampled latency, and response either the reply
+    text or a function of the request contents returning it. error_rate
+    makes that share of calls fail as throttled, and capacity makes calls
+    beyond that many concurrent ones fail the same way, like an overloaded
+    upstream.
+    """
+
+    model_name = "fake"
+
+    def __init__(self, latency: Union[float, Callable[[], float]] = 0.0,
+                 response: Union[str, Callable[[list], str]] = "[{'expr': '2 + 3 * 4', 'result': 14}]",
+                 chunk_size: int = 32, error_rate: float = 0.0, capacity: int = None, seed: int = None):
+        self.latency = latency
+        self.response = response
+        self.chunk_size = chunk_size
+        self.error_rate = error_rate
+        self.capacity = capacity
+        self.calls = 0
+        self.errors = 0
+        self.active = 0
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+
+    def sample_latency(self) -> float:
+        return max(0.0, self.latency()) if callable(self.latency) else self.latency
+
+    def reply(self, contents: list) -> str:
+        return self.response(contents) if callable(self.response) else self.response
+
+    @contextmanager
+    def in_flight(self):
+        with self._lock:
+            self.active += 1
+            overloaded = self.capacity is not None and self.active > self.capacity
+            if overloaded or (self.error_rate and self._random.random() < self.error_rate):
+                self.active -= 1
+                self.errors += 1
+                raise UpstreamThrottled("429 Resource has been exhausted (fake)")
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def create_client(self):
+        return FakeModel(self)
+
+    def warmup(self, client):
+        pass
+
+    def close_client(self, client):
+        pass
+
+
+BACKENDS = {
+    "gemini": GeminiBackend,
+    "fake": FakeBackend,
+}
+
+
+def create_backend(name: str = MODEL_BACKEND):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown model backend '{name}', expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name]()
+
+
+class ModelPool:
+    """
+    A fixed set of model clients. Each client appears in the free queue
+    once per allowed concurrent call, so acquire() blocks once every
+    client is at its limit.
+    """
+
+    def __init__(self, backend, size: int = MODEL_POOL_SIZE,
+                 per_client_concurrency: int = MODEL_CLIENT_CONCURRENCY):
+        self.backend = backend
+        self.clients = [backend.create_client() for _ in range(max(1, size))]
+        self.per_client_concurrency = max(1, per_client_concurrency)
+        self._free = queue.Queue()
+        for _ in range(self.per_client_concurrency):
+            for client in self.clients:
+                self._free.put(client)
+        self._closed = False
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+    @property
+    def capacity(self) -> int:
+        return len(self.clients) * self.per_client_concurrency
+
+    @contextmanager
+    def acquire(self, timeout: float = None):
+        if self._closed:
+            raise RuntimeError("Model pool is closed")
+        try:
+            client = self._free.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("Timed out waiting for a model client") from None
+        with self._lock:
+            self._in_flight += 1
+        try:
+            yield client
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self._idle.notify_all()
+            self._free.put(client)
+
+    def warmup(self):
+        """Connect every client up front so the first requests do not pay for it"""
+        for client in self.clients:
+            self.backend.warmup(client)
+
+    def close(self, timeout: float = 30.0):
+        """Stop handing out clients, wait for in-flight calls, then release the clients"""
+        self._closed = True
+        with self._lock:
+            self._idle.wait_for(lambda: self._in_flight == 0, timeout=timeout)
+        for client in self.clients:
+            self.backend.close_client(client)
+
+
+_pool = None
+# Reentrant so get_model_pool can start the pool while holding it
+_pool_lock = threading.RLock()
+
+
+def start_model_pool(backend=None, **kwargs) -> ModelPool:
+    """Create the shared pool; called from the app lifespan"""
+    global _pool
+    pool = ModelPool(backend or create_backend(), **kwargs)
+    with _pool_lock:
+        previous, _pool = _pool, pool
+    # Closing waits for in-flight calls, so it happens outside the lock
+    if previous is not None:
+        previous.close()
+    logger.info("Model pool started: %s x%d, capacity %d", pool.backend.model_name, len(pool.clients), pool.capacity)
+    return pool
+
+
+def stop_model_pool():
+    global _pool
+    with _pool_lock:
+        previous, _pool = _pool, None
+    if previous is not None:
+        previous.close()
+
+
+def get_model_pool() -> ModelPool:
+    """Return the shared pool, starting a default one if the lifespan has not run"""
+    with _pool_lock:
+        if _pool is None:
+            start_model_pool()
+        return _pool
+
+
+@contextmanager
+def model_client(timeout: float = None):
+    with get_model_pool().acquire(timeout=timeout) as client:
+        yield client
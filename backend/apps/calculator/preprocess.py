@@ -0,0 +1,230 @@
+"""
+Image preprocessing helpers for the calculate route
+"""
+
+import base64
+import math
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from constants import IMAGE_MAX_PIXELS
+
+# A pixel counts as ink when any of its channels is darker than this value
+INK_THRESHOLD = 240
+
+# Canvases whose ink fits in a box this many pixels across are stray marks,
+# answered without calling the model. An absolute size, unlike a ratio, does
+# not drop a single small digit on a large canvas
+BLANK_MAX_SIDE = 10
+
+# Canvases with less ink than this are still solved, but logged as suspicious
+LOW_INK_RATIO = 0.01
+
+# Content detection runs on a copy whose long edge is at most this many pixels
+DETECTION_MAX_SIDE = 512
+
+# The frontend strokes a thin black frame around every selection; ignore it
+FRAME_WIDTH = 3
+
+# Normalization: padding kept around the ink bounding box, and the largest
+# long edge sent to the model
+CROP_MARGIN = 24
+MAX_LONG_EDGE = 1024
+
+# Ink whose channels differ by more than this is treated as colored
+COLOR_SPREAD = 48
+
+# Fraction of ink pixels that must be colored before colors are preserved
+COLOR_INK_RATIO = 0.02
+
+# Palette size used when colors are preserved
+PALETTE_COLORS = 16
+
+
+@dataclass
+class NormalizedImage:
+    image: Image.Image
+    data: bytes
+    mime_type: str
+    original_bytes: int
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_bytes - len(self.data)
+
+    def as_part(self) -> dict:
+        """Blob dict accepted by GenerativeModel.generate_content"""
+        return {"mime_type": self.mime_type, "data": self.data}
+
+
+@dataclass
+class ContentStats:
+    width: int
+    height: int
+    ink_ratio: float
+    bbox: Optional[Tuple[int, int, int, int]]
+
+    @property
+    def ink_pixels(self) -> int:
+        """Estimated number of ink pixels in the full-resolution image"""
+        return int(round(self.ink_ratio * self.width * self.height))
+
+    @property
+    def is_blank(self) -> bool:
+        if self.bbox is None:
+            return True
+        left, top, right, bottom = self.bbox
+        return max(right - left, bottom - top) < BLANK_MAX_SIDE
+
+    @property
+    def is_low_ink(self) -> bool:
+        return self.ink_ratio < LOW_INK_RATIO
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+def decode_data_url(data_url: str) -> bytes:
+    """Extract the raw bytes from a data:image/...;base64,<data> string; ValueError if malformed"""
+    _, sep, data = data_url.partition(",")
+    if not sep:
+        raise ValueError("Not a data URL")
+    return base64.b64decode(data)
+
+
+def open_image(raw: bytes, max_pixels: int = IMAGE_MAX_PIXELS) -> Image.Image:
+    """Decode encoded image bytes into a fully loaded PIL image, refusing canvases over max_pixels"""
+    image = Image.open(BytesIO(raw))
+    # Image.open only reads the header, so this check runs before any pixel is decoded
+    if image.width * image.height > max_pixels:
+        raise ImageTooLarge(f"Image is {image.width}x{image.height}, over {max_pixels} pixels")
+    image.load()
+    return image
+
+
+def flatten_alpha(image: Image.Image, background=(255, 255, 255)) -> Image.Image:
+    """Composite any transparency onto a solid background and return an RGB image"""
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        alpha = image.getchannel("A")
+        if alpha.getextrema()[0] == 255:
+            return image.convert("RGB")
+        canvas = Image.new("RGB", image.size, background)
+        canvas.paste(image, mask=alpha)
+        return canvas
+    if image.mode != "RGB":
+        return image.convert("RGB")
+    return image
+
+
+def ink_mask(image: Image.Image) -> np.ndarray:
+    """Boolean mask of ink pixels for an RGB image"""
+    pixels = np.asarray(image)
+    if pixels.ndim == 3:
+        pixels = pixels.min(axis=2)
+    return pixels < INK_THRESHOLD
+
+
+def reduce_for_detection(image: Image.Image) -> Tuple[Image.Image, int, int]:
+    """
+    Box-downscale an RGB canvas for content detection and cut off the
+    selection frame. Returns (copy, factor, inset); pixel (x, y) of the copy
+    starts at ((x + inset) * factor, (y + inset) * factor) in the original.
+    """
+    width, height = image.size
+    factor = max(1, math.ceil(max(width, height) / DETECTION_MAX_SIDE))
+    small = image.reduce(factor) if factor > 1 else image
+
+    # The last reduced row and column cover a partial block when the size is
+    # not a multiple of factor, so the far edges of the frame can span one more
+    inset = min(math.ceil(FRAME_WIDTH / factor), min(small.size) // 2)
+    right = max(inset, small.width - (width - FRAME_WIDTH) // factor)
+    bottom = max(inset, small.height - (height - FRAME_WIDTH) // factor)
+    if small.width - inset - right <= 0 or small.height - inset - bottom <= 0:
+        right, bottom = inset, inset
+    if right or bottom:
+        small = small.crop((inset, inset, small.width - right, small.height - bottom))
+    return small, factor, inset
+
+
+def detect_content(image: Image.Image) -> ContentStats:
+    """
+    Measure how much ink a canvas holds and where it is.
+
+    Works on a box-downscaled copy so the cost is bounded regardless of
+    canvas size; the bounding box is mapped back to full-resolution pixels.
+    """
+    image = flatten_alpha(image)
+    width, height = image.size
+    small, factor, inset = reduce_for_detection(image)
+
+    # Cheap histogram check: nothing darker than the threshold anywhere
+    extrema = small.getextrema()
+    if min(low for low, _ in extrema) >= INK_THRESHOLD:
+        return ContentStats(width, height, 0.0, None)
+
+    mask = ink_mask(small)
+    ink_ratio = float(np.count_nonzero(mask)) / mask.size if mask.size else 0.0
+
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+    if rows.size == 0:
+        return ContentStats(width, height, 0.0, None)
+
+    bbox = (
+        min(width, (int(cols[0]) + inset) * factor),
+        min(height, (int(rows[0]) + inset) * factor),
+        min(width, (int(cols[-1]) + inset + 1) * factor),
+        min(height, (int(rows[-1]) + inset + 1) * factor),
+    )
+    return ContentStats(width, height, ink_ratio, bbox)
+
+
+def _has_color(image: Image.Image) -> bool:
+    """True when a meaningful share of the ink is colored rather than gray"""
+    small = image.reduce(max(1, math.ceil(max(image.size) / DETECTION_MAX_SIDE)))
+    pixels = np.asarray(small).astype(np.int16)
+    ink = pixels.min(axis=2) < INK_THRESHOLD
+    ink_count = np.count_nonzero(ink)
+    if not ink_count:
+        return False
+    spread = pixels.max(axis=2) - pixels.min(axis=2)
+    colored = np.count_nonzero(ink & (spread > COLOR_SPREAD))
+    return colored / ink_count >= COLOR_INK_RATIO
+
+
+def normalize_image(image: Image.Image, stats: ContentStats, original_bytes: int = 0) -> NormalizedImage:
+    """
+    Shrink a canvas to what the model needs to see: crop to the ink with a
+    margin, cap the long edge, drop color when the drawing is monochrome
+    (otherwise reduce it to a small palette) and re-encode as PNG.
+    """
+    image = flatten_alpha(image)
+
+    if stats.bbox is not None:
+        left, top, right, bottom = stats.bbox
+        image = image.crop((
+            max(0, left - CROP_MARGIN),
+            max(0, top - CROP_MARGIN),
+            min(image.width, right + CROP_MARGIN),
+            min(image.height, bottom + CROP_MARGIN),
+        ))
+
+    if max(image.size) > MAX_LONG_EDGE:
+        scale = MAX_LONG_EDGE / max(image.size)
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image = image.resize(size, Image.Resampling.LANCZOS)
+
+    if _has_color(image):
+        image = image.quantize(colors=PALETTE_COLORS, method=Image.Quantize.MEDIANCUT)
+    else:
+        image = image.convert("L")
+
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return NormalizedImage(image, buffer.getvalue(), "image/png", original_bytes)
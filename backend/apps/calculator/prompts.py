@@ -0,0 +1,156 @@
+"""
+Precompiled prompt templates for analyze_image
+
+Every prompt is fully determined by the math mode and the detailed_steps
+flag except for the user's variables and the formulas picked for the
+request, so all mode x steps variants are built once at import time and
+only those two pieces are spliced in per request.
+"""
+
+import hashlib
+import json
+from dataclasses import dataclass
+
+from apps.calculator.formula_retrieval import select_formulas
+from constants import FORMULA_TOKEN_BUDGET, FORMULA_TOP_K
+from formula_library import MODE_TO_FORMULAS
+from schema import MathMode
+
+# Mode-specific instructions
+MODE_INSTRUCTIONS = {
+    MathMode.BASIC: (
+        "Note: Use the PEMDAS rule for solving mathematical expressions. PEMDAS stands for the Priority Order: Parentheses, Exponents, "
+        "Multiplication and Division (from left to right), Addition and Subtraction (from left to right). "
+        "For example: "
+        "Q. 2 + 3 * 4 "
+        "(3 * 4) => 12, 2 + 12 = 14. "
+        "Q. 2 + 3 + 5 * 4 - 8 / 2 "
+        "5 * 4 => 20, 8 / 2 => 4, 2 + 3 => 5, 5 + 20 => 25, 25 - 4 => 21. "
+    ),
+    MathMode.ALGEBRA: (
+        "Focus on algebraic expressions and equations. Manipulate expressions, solve for variables, "
+        "factor polynomials, and simplify expressions. "
+        "For quadratic equations, use the quadratic formula x = (-b ± √(b² - 4ac))/2a when appropriate. "
+        "Apply factoring techniques when possible. "
+    ),
+    MathMode.CALCULUS: (
+        "Focus on calculus problems including derivatives, integrals, limits, and related topics. "
+        "When computing derivatives, apply appropriate rules (power rule, product rule, quotient rule, chain rule). "
+        "For integrals, use appropriate integration techniques and include the constant of integration. "
+        "For limits, try direct substitution first, then analytical methods if needed. "
+    ),
+    MathMode.GEOMETRY: (
+        "Focus on geometry problems including areas, volumes, angles, and spatial relationships. "
+        "For triangles, use the appropriate formulas (area = ½bh, Pythagorean theorem, etc.). "
+        "For circles, use area = πr² and circumference = 2πr. "
+        "Pay close attention to units and diagrams showing measurements. "
+    ),
+    MathMode.STATISTICS: (
+        "Focus on statistics problems including mean, median, mode, standard deviation, probability, "
+        "distributions, and data analysis. "
+        "For datasets, calculate descriptive statistics properly. "
+        "For probability problems, identify the correct probability model and apply appropriate formulas. "
+        "For distributions, use the correct probability density/mass functions. "
+    )
+}
+
+# Steps instructions used when detailed_steps is set
+STEPS_INSTRUCTION = (
+    "For EACH problem, provide detailed step-by-step explanations. Break down the solution into logical steps, "
+    "explaining the reasoning at each point. Include relevant formulas used and why they apply. "
+    "The steps should be educational and help build understanding of the concepts involved. "
+)
+
+_STEPS_FIELDS = ", 'steps': [step1, step2, step3, ...], 'formulas_used': [{{name: formula_name, formula: formula_text, explanation: explanation_text}}, ...]"
+
+
+def _result_format(fields: str, detailed_steps: bool) -> str:
+    return "{{" + fields + (_STEPS_FIELDS if detailed_steps else "") + "}}"
+
+
+def _case_instructions(detailed_steps: bool) -> str:
+    expression_format = _result_format("'expr': given expression, 'result': calculated answer", detailed_steps)
+    return (
+        "YOU CAN HAVE FIVE TYPES OF EQUATIONS/EXPRESSIONS IN THIS IMAGE, AND ONLY ONE CASE SHALL APPLY EVERY TIME: "
+        "Following are the cases: "
+        "1. Simple mathematical expressions like 2 + 2, 3 * 4, 5 / 6, 7 - 8, etc.: In this case, solve and return the answer in the format of a LIST OF ONE DICT ["
+        + expression_format
+        + "]. "
+        "2. Set of Equations like x^2 + 2x + 1 = 0, 3y + 4x = 0, 5x^2 + 6y + 7 = 12, etc.: In this case, solve for the given variable, and the format should be a COMMA SEPARATED LIST OF DICTS, with dict 1 as "
+        + _result_format("'expr': 'x', 'result': 2, 'assign': True", detailed_steps)
+        + " and dict 2 as "
+        + _result_format("'expr': 'y', 'result': 5, 'assign': True", detailed_steps)
+        + ". This example assumes x was calculated as 2, and y as 5. Include as many dicts as there are variables. "
+        "3. Assigning values to variables like x = 4, y = 5, z = 6, etc.: In this case, assign values to variables and return another key in the dict called {'assign': True}, keeping the variable as 'expr' and the value as 'result' in the original dictionary. RETURN AS A LIST OF DICTS. "
+        "4. Analyzing Graphical Math problems, which are word problems represented in drawing form, such as cars colliding, trigonometric problems, problems on the Pythagorean theorem, adding runs from a cricket wagon wheel, etc. These will have a drawing representing some scenario and accompanying information with the image. PAY CLOSE ATTENTION TO DIFFERENT COLORS FOR THESE PROBLEMS. You need to return the answer in the format of a LIST OF ONE DICT ["
+        + expression_format
+        + "]. "
+        "5. Detecting Abstract Concepts that a drawing might show, such as love, hate, jealousy, patriotism, or a historic reference to war, invention, discovery, quote, etc. USE THE SAME FORMAT AS OTHERS TO RETURN THE ANSWER, where 'expr' will be the explanation of the drawing, and 'result' will be the abstract concept. "
+    )
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    mode: MathMode
+    detailed_steps: bool
+    prefix: str
+    middle: str
+    suffix: str
+
+    def render(self, dict_of_vars: dict, formulas_str: str = None) -> str:
+        """Fill in the variables and formulas; formulas default to a relevance pick for the vars"""
+        if formulas_str is None:
+            formulas_str = select_formulas(self.mode, dict_of_vars)
+        return self.prefix + json.dumps(dict_of_vars, ensure_ascii=False) + self.middle + formulas_str + self.suffix
+
+
+def _build_template(mode: MathMode, detailed_steps: bool) -> PromptTemplate:
+    prefix = (
+        "You have been given an image with some mathematical expressions, equations, or graphical problems, and you need to solve them. "
+        f"You are operating in '{mode.value}' mode. "
+        f"{MODE_INSTRUCTIONS[mode]}"
+        f"{STEPS_INSTRUCTION if detailed_steps else ''}"
+        f"{_case_instructions(detailed_steps)}"
+        "Analyze the equation or expression in this image and return the answer according to the given rules: "
+        "Make sure to use extra backslashes for escape characters like \\f -> \\\\f, \\n -> \\\\n, etc. "
+        "Here is a dictionary of user-assigned variables. If the given expression has any of these variables, use its actual value from this dictionary accordingly: "
+    )
+    middle = (
+        ". "
+        f"Here are relevant formulas that may apply to this '{mode.value}' problem: "
+    )
+    suffix = (
+        ". Use these when applicable and reference them in your answer. "
+        "DO NOT USE BACKTICKS OR MARKDOWN FORMATTING. "
+        "PROPERLY QUOTE THE KEYS AND VALUES IN THE DICTIONARY FOR EASIER PARSING WITH Python's ast.literal_eval."
+    )
+    return PromptTemplate(mode, detailed_steps, prefix, middle, suffix)
+
+
+TEMPLATES = {
+    (mode, detailed_steps): _build_template(mode, detailed_steps)
+    for mode in MathMode
+    for detailed_steps in (False, True)
+}
+
+# Changes whenever any template text, the loaded formula library or the
+# formula selection limits change, so cached answers produced by an older
+# prompt are not reused
+_PROMPT_INPUTS = "".join(t.prefix + t.middle + t.suffix for t in TEMPLATES.values()) + json.dumps(
+    [MODE_TO_FORMULAS, FORMULA_TOP_K, FORMULA_TOKEN_BUDGET], sort_keys=True, ensure_ascii=False, default=str
+)
+TEMPLATE_VERSION = hashlib.sha256(_PROMPT_INPUTS.encode()).hexdigest()[:12]
+
+
+def get_template(mode: str, detailed_steps: bool) -> PromptTemplate:
+    """Return the precompiled template, falling back to basic mode for unknown modes"""
+    try:
+        mode = MathMode(mode)
+    except ValueError:
+        mode = MathMode.BASIC
+    return TEMPLATES[(mode, bool(detailed_steps))]
+
+
+def build_prompt(mode: str, dict_of_vars: dict, detailed_steps: bool, formula_hint: str = "") -> str:
+    template = get_template(mode, detailed_steps)
+    return template.render(dict_of_vars, select_formulas(template.mode, dict_of_vars, formula_hint))
@@ -0,0 +1,217 @@
+"""
+Parsing and validation of the model's replies
+
+The model is asked for a Python-literal list of answer dicts, but replies
+arrive wrapped in code fences, prefixed with prose, written as JSON, or
+cut off mid-list. parse_answers tries the cheap exact parsers first and
+only then repairs the text, falling back to recovering whichever answer
+dicts are complete. Every answer is validated against schema.MathSolution.
+With structured output enabled the model returns JSON matching
+RESPONSE_SCHEMA and no heuristics are needed.
+"""
+
+import ast
+import json
+import logging
+import re
+import threading
+import time
+from typing import Optional
+
+from pydantic import ValidationError
+
+from apps.calculator.stream_parser import IncrementalResultParser
+from schema import MathSolution
+
+logger = logging.getLogger(__name__)
+
+_FENCE = re.compile(r"```[A-Za-z]*\s*(.*?)\s*(?:```|$)", re.DOTALL)
+_JSON_CONSTANT = re.compile(r"""('(?:\\.|[^'\\])*'|"(?:\\.|[^"\\])*")|\b(true|false|null)\b""")
+_PYTHON_CONSTANTS = {"true": "True", "false": "False", "null": "None"}
+
+# JSON schema handed to the model when structured output is enabled; the
+# result is a string because the schema language has no "any" type
+RESPONSE_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "expr": {"type": "string"},
+            "result": {"type": "string"},
+            "assign": {"type": "boolean"},
+            "steps": {"type": "array", "items": {"type": "string"}},
+            "formulas_used": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "name": {"type": "string"},
+                        "formula": {"type": "string"},
+                        "explanation": {"type": "string"},
+                    },
+                    "required": ["name", "formula", "explanation"],
+                },
+            },
+        },
+        "required": ["expr", "result"],
+    },
+}
+
+
+def _json_to_python(source: str) -> str:
+    """Rewrite bare true/false/null as Python constants, leaving strings alone"""
+    return _JSON_CONSTANT.sub(lambda m: m.group(1) or _PYTHON_CONSTANTS[m.group(2)], source)
+
+
+def _load(source: str):
+    """Exact parse as a Python literal, then as JSON; raises ValueError when neither works"""
+    try:
+        return ast.literal_eval(source)
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        pass
+    try:
+        return json.loads(source)
+    except ValueError:
+        pass
+    try:
+        return ast.literal_eval(_json_to_python(source))
+    except (ValueError, SyntaxError, MemoryError, RecursionError) as e:
+        raise ValueError(str(e)) from None
+
+
+def _extract_body(text: str) -> str:
+    """Drop code fences and any prose around the outermost list or dict"""
+    fenced = _FENCE.search(text)
+    if fenced:
+        text = fenced.group(1)
+    starts = [i for i in (text.find("["), text.find("{")) if i != -1]
+    if not starts:
+        return text
+    start = min(starts)
+    end = max(text.rfind("]"), text.rfind("}"))
+    return text[start:end + 1] if end > start else text[start:]
+
+
+def _as_items(value) -> list:
+    if isinstance(value, dict):
+        return [value]
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    raise ValueError(f"Expected a list of answers, got {type(value).__name__}")
+
+
+def _coerce_result(value):
+    """Structured output carries results as strings; turn numeric ones back into numbers"""
+    if isinstance(value, str):
+        try:
+            number = ast.literal_eval(value.strip())
+        except (ValueError, SyntaxError, MemoryError, RecursionError):
+            return value
+        if isinstance(number, (int, float)) and not isinstance(number, bool):
+            return number
+    return value
+
+
+def validate_answer(answer, detailed_steps: bool = False) -> Optional[dict]:
+    """Validate one answer dict into the shape the frontend relies on, or None if unusable"""
+    if not isinstance(answer, dict):
+        return None
+    answer = dict(answer)
+    if "expr" in answer and not isinstance(answer["expr"], str):
+        answer["expr"] = str(answer["expr"])
+    answer["assign"] = bool(answer.get("assign", False))
+    try:
+        solution = MathSolution.model_validate(answer)
+    except ValidationError:
+        # Malformed steps or formulas should not cost the answer itself
+        answer.pop("steps", None)
+        answer.pop("formulas_used", None)
+        try:
+            solution = MathSolution.model_validate(answer)
+        except ValidationError:
+            return None
+    result = solution.model_dump(exclude_none=True)
+    if detailed_steps and "steps" not in result:
+        result["steps"] = []
+    return result
+
+
+class ParseStats:
+    """How model replies were parsed, for spotting prompt or model regressions"""
+
+    OUTCOMES = ("ok", "repaired", "partial", "failed")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counts = {outcome: 0 for outcome in self.OUTCOMES}
+            self._seconds = 0.0
+
+    def record(self, outcome: str, seconds: float):
+        with self._lock:
+            self._counts[outcome] += 1
+            self._seconds += seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            total = sum(self._counts.values())
+            return {
+                "total": total,
+                "outcomes": dict(self._counts),
+                "failure_rate": self._counts["failed"] / total if total else 0.0,
+                "avg_us": self._seconds / total * 1e6 if total else 0.0,
+            }
+
+
+parse_stats = ParseStats()
+
+
+def _parse(text: str, structured: bool):
+    """Return (items, outcome) for a raw reply"""
+    stripped = text.strip()
+    if structured:
+        try:
+            return _as_items(json.loads(stripped)), "ok"
+        except ValueError:
+            pass
+    else:
+        try:
+            return _as_items(ast.literal_eval(stripped)), "ok"
+        except (ValueError, SyntaxError, MemoryError, RecursionError):
+            pass
+
+    body = _extract_body(stripped)
+    try:
+        return _as_items(_load(body)), "repaired"
+    except ValueError:
+        pass
+
+    # Truncated or otherwise broken list: keep every answer dict that closed
+    parser = IncrementalResultParser()
+    items = [value for kind, _, value in parser.feed(body) if kind == "result"]
+    if not items:
+        items = [value for kind, _, value in IncrementalResultParser().feed(_json_to_python(body)) if kind == "result"]
+    return items, "partial" if items else "failed"
+
+
+def parse_answers(text: str, detailed_steps: bool = False, structured: bool = False) -> list:
+    """Turn the model's reply into a list of validated answer dicts"""
+    start = time.perf_counter()
+    items, outcome = _parse(text or "", structured)
+    answers = [answer for answer in (validate_answer(item, detailed_steps) for item in items) if answer is not None]
+    if len(answers) < len(items):
+        outcome = "partial" if answers else "failed"
+    if structured:
+        for answer in answers:
+            answer["result"] = _coerce_result(answer["result"])
+    parse_stats.record(outcome, time.perf_counter() - start)
+
+    if outcome == "failed":
+        logger.warning("Error in parsing response from Gemini API: no usable answers")
+        logger.debug("Raw response: %s", text)
+    elif outcome == "partial":
+        logger.warning("Recovered %d answer(s) from a malformed response", len(answers))
+    return answers
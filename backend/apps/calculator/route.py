@@ -1,59 +1,452 @@
-from fastapi import APIRouter
-import base64
-from io import BytesIO
-from apps.calculator.utils import analyze_image
-from schema import ImageData
+import asyncio
+import json
+import logging
+import threading
+import time
+from typing import Optional, Union
+from fastapi import APIRouter, Header, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from PIL import Image
+from apps.calculator.utils import analyze_image, stream_analyze_image
+from apps.calculator.admission import Overloaded, model_admission
+from apps.calculator.stream_parser import IncrementalResultParser
+from apps.calculator.cache import image_hash, make_answers_key, make_key, result_cache
+from apps.calculator.local_solver import solve_locally, tier_stats
+from apps.calculator.preprocess import (ImageTooLarge, decode_data_url, detect_content, flatten_alpha, normalize_image,
+                                        open_image)
+from apps.calculator.response_parser import parse_stats, validate_answer
+from apps.calculator.segmentation import segment_canvas
+from apps.calculator.singleflight import model_flight
+from apps.calculator.workers import run_image_task, run_model_call
+from constants import (BATCH_CONCURRENCY, BATCH_MAX_ITEMS, CANVAS_SEGMENTATION, SEGMENT_MAX_REGIONS,
+                       TRUSTED_PROXIES, UPLOAD_MAX_BYTES)
+from observability import NORMALIZE_BYTES_SAVED, registry, span
+from schema import BatchImageData, ImageData, MathMode
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-@router.post('')
-async def run(data: ImageData):
-    image_data = base64.b64decode(data.image.split(",")[1])  # Assumes data:image/png;base64,<data>
-    image_bytes = BytesIO(image_data)
-    image = Image.open(image_bytes)
+UPLOAD_CONTENT_TYPES = {"application/octet-stream", "image/png", "image/webp", "image/jpeg"}
+
+
+def client_id(request: Request) -> str:
+    """
+    Who a request is charged to: the peer address, or the X-Client-ID
+    header when the peer is a trusted proxy. Clients could otherwise pick
+    a fresh ID per request and bypass their rate limit.
+    """
+    peer = request.client.host if request.client else "anonymous"
+    if peer in TRUSTED_PROXIES:
+        return request.headers.get("x-client-id") or peer
+    return peer
+
+
+def _load_canvas(source: Union[str, bytes]):
+    """Decode the canvas and measure its ink; source is a base64 data URL or the raw encoded image bytes"""
+    if isinstance(source, str):
+        with span("base64_decode"):
+            try:
+                raw = decode_data_url(source)  # Expects data:image/png;base64,<data>
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Image must be a base64 data URL")
+    else:
+        raw = source
+    with span("image_decode"):
+        try:
+            image = open_image(raw)
+        except (ImageTooLarge, Image.DecompressionBombError) as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except OSError:
+            # UnidentifiedImageError and truncated files; the caller sent something that is not an image
+            raise HTTPException(status_code=400, detail="Image could not be decoded")
     
     # Log image information for debugging
-    print(f"Received image: {image.format}, {image.size}, {image.mode}")
+    logger.debug("Received image: %s, %s, %s", image.format, image.size, image.mode)
+    
+    with span("blank_check"):
+        image = flatten_alpha(image)
+        stats = detect_content(image)
+    logger.debug("Image analysis: ~%d non-white pixels out of %d total pixels",
+                 stats.ink_pixels, stats.width * stats.height)
+    return image, stats, len(raw)
+
+
+def _normalize(image, stats, raw_size: int):
+    with span("normalize"):
+        normalized = normalize_image(image, stats, original_bytes=raw_size)
+        img_hash = image_hash(normalized.image)
+    NORMALIZE_BYTES_SAVED.observe(normalized.bytes_saved)
+    logger.debug("Normalized image: %s %s, %d -> %d bytes (%d saved)", normalized.image.size,
+                 normalized.image.mode, raw_size, len(normalized.data), normalized.bytes_saved)
+    return normalized, img_hash
+
+
+def prepare_image(source: Union[str, bytes]):
+    """Decode, inspect and normalize the whole canvas; runs in the image worker pool"""
+    image, stats, raw_size = _load_canvas(source)
+    if stats.is_blank:
+        return None, stats, None
+    normalized, img_hash = _normalize(image, stats, raw_size)
+    return normalized, stats, img_hash
+
+
+def prepare_regions(source: Union[str, bytes]):
+    """
+    Like prepare_image, but a canvas holding several separate problems is
+    split and each region normalized on its own. Returns the canvas stats
+    and a (normalized, img_hash) pair per region.
+    """
+    image, stats, raw_size = _load_canvas(source)
+    if stats.is_blank:
+        return stats, []
+    regions = []
+    if CANVAS_SEGMENTATION:
+        with span("segment"):
+            regions = segment_canvas(image, SEGMENT_MAX_REGIONS)
+        if regions:
+            logger.debug("Split canvas into %d regions", len(regions))
+    return stats, [_normalize(image, region, raw_size) for region in regions or [stats]]
+
+
+async def find_answers(img_hash: str, dict_of_vars: dict, mode: MathMode, detailed_steps: bool):
+    """
+    Try the tiers that need no model call: the result cache, then the local
+    solver over the answers the model gave for this canvas before.
+    Returns (tier, answers), or (None, None) when the model is needed.
+    """
+    responses = await result_cache.aget(make_key(img_hash, dict_of_vars, mode, detailed_steps))
+    if responses is not None:
+        logger.info("Serving cached result")
+        return "cache", responses
+    
+    previous = await result_cache.aget(make_answers_key(img_hash, mode), track=False)
+    if previous is not None:
+        # Evaluation is CPU work, so it stays off the event loop
+        responses = await run_image_task(solve_locally, previous["answers"], previous["vars"], dict_of_vars,
+                                         detailed_steps)
+        if responses is not None:
+            logger.info("Solved locally from previous answers")
+            return "local", responses
+    return None, None
+
+
+async def formula_hint(img_hash: str, mode: MathMode) -> str:
+    """Expressions the model read off this canvas before, used to pick relevant formulas"""
+    previous = await result_cache.aget(make_answers_key(img_hash, mode), track=False)
+    if previous is None:
+        return ""
+    return " ".join(str(answer.get("expr", "")) for answer in previous["answers"])
+
+
+async def store_answers(img_hash: str, dict_of_vars: dict, mode: MathMode, detailed_steps: bool, responses: list):
+    await result_cache.aset(make_key(img_hash, dict_of_vars, mode, detailed_steps), responses)
+    if responses:
+        await result_cache.aset(make_answers_key(img_hash, mode), {"answers": responses, "vars": dict_of_vars})
+
+
+async def solve_region(normalized, img_hash: str, dict_of_vars: dict, mode: MathMode, detailed_steps: bool,
+                       client: Optional[str]) -> list:
+    """
+    Answer one normalized image from the cheapest tier that can. client is
+    charged if a model call is started; None means the caller already paid.
+    """
+    start = time.perf_counter()
+    tier, responses = await find_answers(img_hash, dict_of_vars, mode, detailed_steps)
+    if responses is None:
+        key = make_key(img_hash, dict_of_vars, mode, detailed_steps)
+        if client is not None and not model_flight.in_flight(key):
+            # Only a request that starts a model call spends its client's tokens
+            model_admission.admit_client(client)
+        async def call_model():
+            hint = await formula_hint(img_hash, mode)
+            # Pass mode and detailed_steps parameters from request
+            responses = await model_admission.call(lambda: run_model_call(
+                analyze_image,
+                normalized.as_part(),
+                dict_of_vars=dict_of_vars,
+                mode=mode,
+                detailed_steps=detailed_steps,
+                formula_hint=hint
+            ))
+            with span("postprocess"):
+                await store_answers(img_hash, dict_of_vars, mode, detailed_steps, responses)
+            return responses
+        
+        # Identical canvases solved at the same moment share one model call
+        responses, shared = await model_flight.run(key, call_model)
+        tier = "coalesced" if shared else "model"
+    tier_stats.record(tier, time.perf_counter() - start)
+    return responses
+
+
+async def solve(source: Union[str, bytes], dict_of_vars: dict, mode: MathMode, detailed_steps: bool,
+                client: Optional[str]) -> dict:
+    """Run one canvas through preprocessing, the result cache and the model"""
+    stats, regions = await run_image_task(prepare_regions, source)
     
     # Check if the image is mostly blank or has content
-    has_content = False
-    if image.mode == 'RGBA':
-        # Convert to RGB for simpler processing
-        image = image.convert('RGB')
-    
-    # Count non-white pixels to see if we have content (simple check)
-    pixels = image.load()
-    width, height = image.size
-    non_white_count = 0
-    for y in range(height):
-        for x in range(width):
-            pixel = pixels[x, y]
-            # If not white (allowing some tolerance)
-            if any(channel < 240 for channel in pixel):
-                non_white_count += 1
-    
-    print(f"Image analysis: {non_white_count} non-white pixels out of {width*height} total pixels")
-    has_content = non_white_count > (width * height * 0.01)  # At least 1% non-white
-    
-    if not has_content:
-        print("Warning: Image appears to be mostly blank")
-    
-    # Pass mode and detailed_steps parameters from request
-    responses = analyze_image(
-        image, 
-        dict_of_vars=data.dict_of_vars,
-        mode=data.mode,
-        detailed_steps=data.detailed_steps
-    )
+    if stats.is_blank:
+        logger.info("Image is blank, skipping analysis")
+        return {
+            "message": "No content detected in image",
+            "data": [],
+            "status": "empty"
+        }
     
+    if stats.is_low_ink:
+        logger.warning("Image appears to be mostly blank")
+    
+    # Regions are solved concurrently and cached one by one, so editing one
+    # problem leaves the others' answers in the cache
+    solved = await asyncio.gather(
+        *(solve_region(normalized, img_hash, dict_of_vars, mode, detailed_steps, client)
+          for normalized, img_hash in regions),
+        return_exceptions=True,
+    )
     result_data = []
-    for response in responses:
-        result_data.append(response)
+    for responses in solved:
+        if isinstance(responses, BaseException):
+            raise responses
+        result_data.extend(responses)
     
-    print('response in route: ', responses)
+    logger.debug("Response in route: %s", result_data)
     return {
-        "message": f"Image processed in {data.mode} mode", 
+        "message": f"Image processed in {mode} mode", 
         "data": result_data, 
         "status": "success"
     }
+
+
+@router.post('')
+async def run(data: ImageData, request: Request):
+    return await solve(data.image, data.dict_of_vars, data.mode, data.detailed_steps, client_id(request))
+
+
+@router.post('/upload')
+async def run_upload(
+    request: Request,
+    content_type: str = Header("application/octet-stream"),
+    x_dict_of_vars: str = Header("{}"),
+    x_math_mode: MathMode = Header(MathMode.BASIC),
+    x_detailed_steps: bool = Header(False),
+):
+    """
+    Same as POST /calculate, but the body is the raw PNG/WebP/JPEG bytes
+    instead of a base64 data URL inside JSON. Variables, mode and the
+    steps flag travel in the X-Dict-Of-Vars (JSON), X-Math-Mode and
+    X-Detailed-Steps headers.
+    """
+    if content_type.split(";")[0].strip().lower() not in UPLOAD_CONTENT_TYPES:
+        raise HTTPException(status_code=415, detail=f"Unsupported content type '{content_type}'")
+    try:
+        dict_of_vars = json.loads(x_dict_of_vars)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="X-Dict-Of-Vars must be a JSON object")
+    if not isinstance(dict_of_vars, dict):
+        raise HTTPException(status_code=400, detail="X-Dict-Of-Vars must be a JSON object")
+    
+    # Collect the body chunk by chunk so oversized uploads are rejected early;
+    # the single join is the only copy before PIL decodes it
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > UPLOAD_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"Image is larger than {UPLOAD_MAX_BYTES} bytes")
+        chunks.append(chunk)
+    if not size:
+        raise HTTPException(status_code=400, detail="Request body is empty")
+    
+    return await solve(b"".join(chunks), dict_of_vars, x_math_mode, x_detailed_steps, client_id(request))
+
+
+async def _solve_item(index: int, item: ImageData, limit: asyncio.Semaphore) -> dict:
+    async with limit:
+        try:
+            # The batch was charged as a whole up front
+            return {"index": index, **await solve(item.image, item.dict_of_vars, item.mode, item.detailed_steps, None)}
+        except Overloaded as e:
+            return {"index": index, "data": [], "status": "error", "error": str(e), "retry_after": e.retry_after}
+        except Exception as e:
+            logger.exception("Error solving batch item %d", index)
+            return {"index": index, "data": [], "status": "error", "error": str(e)}
+
+
+@router.post('/batch')
+async def run_batch(batch: BatchImageData, request: Request):
+    """
+    Solve many canvases in one request. Items are solved concurrently (at
+    most BATCH_CONCURRENCY at a time); with stream=true each result is
+    written as an NDJSON line as soon as it completes, otherwise all
+    results are returned together in request order. The whole batch is
+    charged to the client's rate limit before any item is solved, so it is
+    either admitted or rejected with 429 as a unit.
+    """
+    if len(batch.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch is limited to {BATCH_MAX_ITEMS} items")
+    model_admission.admit_client(client_id(request), cost=len(batch.items))
+    limit = asyncio.Semaphore(BATCH_CONCURRENCY)
+    tasks = [asyncio.create_task(_solve_item(i, item, limit)) for i, item in enumerate(batch.items)]
+    
+    if not batch.stream:
+        results = await asyncio.gather(*tasks)
+        return {
+            "message": f"Processed {len(results)} images",
+            "data": results,
+            "status": "success"
+        }
+    
+    async def stream_results():
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                yield json.dumps(result, ensure_ascii=False, default=str) + "\n"
+        finally:
+            # Client went away or the stream finished; stop any leftover work
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
+def _sse(event: str, payload) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False, default=str)}\n\n"
+
+
+async def _stream_solution(data: ImageData, client: str):
+    normalized, stats, img_hash = await run_image_task(prepare_image, data.image)
+    
+    if stats.is_blank:
+        logger.info("Image is blank, skipping analysis")
+        yield _sse("done", {"message": "No content detected in image", "data": [], "status": "empty"})
+        return
+    
+    start = time.perf_counter()
+    tier, responses = await find_answers(img_hash, data.dict_of_vars, data.mode, data.detailed_steps)
+    if responses is None:
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        stop = threading.Event()
+        hint = await formula_hint(img_hash, data.mode)
+        try:
+            model_admission.admit_client(client)
+            await model_admission.limiter.acquire()
+            call = asyncio.ensure_future(run_model_call(
+                stream_analyze_image,
+                normalized.as_part(),
+                dict_of_vars=data.dict_of_vars,
+                mode=data.mode,
+                detailed_steps=data.detailed_steps,
+                on_text=lambda text: loop.call_soon_threadsafe(chunks.put_nowait, text),
+                stop=stop,
+                formula_hint=hint
+            ))
+            # The slot is freed when the model thread finishes, not when the client leaves
+            model_admission.limiter.release_when_done(call)
+            call.add_done_callback(lambda _: chunks.put_nowait(None))
+            
+            parser = IncrementalResultParser()
+            try:
+                while (text := await chunks.get()) is not None:
+                    for kind, index, value in parser.feed(text):
+                        if kind == "step":
+                            yield _sse("step", {"index": index, "step": value})
+                        elif (answer := validate_answer(value, data.detailed_steps)) is not None:
+                            yield _sse("result", {"index": index, "result": answer})
+                responses = await call
+            finally:
+                # Client disconnected or the model failed; stop reading the stream
+                stop.set()
+        except Overloaded as e:
+            yield _sse("error", {"message": str(e), "status": "error", "retry_after": e.retry_after})
+            return
+        except Exception as e:
+            logger.exception("Error streaming solution")
+            yield _sse("error", {"message": str(e), "status": "error"})
+            return
+        tier = "model"
+        with span("postprocess"):
+            await store_answers(img_hash, data.dict_of_vars, data.mode, data.detailed_steps, responses)
+    else:
+        for index, answer in enumerate(responses):
+            yield _sse("result", {"index": index, "result": answer})
+    
+    tier_stats.record(tier, time.perf_counter() - start)
+    yield _sse("done", {
+        "message": f"Image processed in {data.mode} mode",
+        "data": responses,
+        "status": "success"
+    })
+
+
+@router.post('/stream')
+async def run_stream(data: ImageData, request: Request):
+    """
+    Server-sent events version of POST /calculate: 'step' events carry
+    each solution step as the model writes it, 'result' events each
+    finished answer, and the final 'done' event the same body /calculate
+    would have returned. The canvas is always solved whole here.
+    """
+    return StreamingResponse(_stream_solution(data, client_id(request)), media_type="text/event-stream")
+
+
+@router.get('/cache')
+async def cache_stats():
+    """Hit/miss counters and size of the result cache"""
+    return result_cache.stats()
+
+
+@router.get('/parser')
+async def parser_stats():
+    """How model replies were parsed: cleanly, repaired, partially recovered or failed"""
+    return parse_stats.snapshot()
+
+
+@router.get('/coalescing')
+async def coalescing_stats():
+    """Model calls started, and requests that joined an identical call already in flight"""
+    return model_flight.stats()
+
+
+@router.get('/admission')
+async def admission_stats():
+    """Current model concurrency limit, queue depth and rejection counters"""
+    return model_admission.stats()
+
+
+@router.get('/tiers')
+async def solver_tiers():
+    """How often each solver tier answered, and how long it took"""
+    return tier_stats.snapshot()
+
+
+def _solver_metrics() -> list:
+    """Counters kept by the cache, tiers, parser and coalescing, in Prometheus form"""
+    tiers = tier_stats.snapshot()
+    parsing = parse_stats.snapshot()
+    cache = result_cache.stats()
+    flight = model_flight.stats()
+    admission = model_admission.stats()
+    return [
+        ("solve_tier_total", "counter", "Solves answered by each tier",
+         [({"tier": tier}, values["hits"]) for tier, values in tiers.items()]),
+        ("model_reply_parse_total", "counter", "Model replies by parse outcome",
+         [({"outcome": outcome}, count) for outcome, count in parsing["outcomes"].items()]),
+        ("result_cache_lookups_total", "counter", "Result cache lookups",
+         [({"result": "hit"}, cache["hits"]), ({"result": "miss"}, cache["misses"])]),
+        ("result_cache_bytes", "gauge", "Bytes held by the in-memory result cache", [({}, cache["bytes"])]),
+        ("model_calls_coalesced_total", "counter", "Requests that joined an identical in-flight model call",
+         [({}, flight["coalesced"])]),
+        ("model_calls_in_flight", "gauge", "Distinct model calls currently running", [({}, flight["in_flight"])]),
+        ("model_concurrency_limit", "gauge", "Adaptive limit on concurrent model calls", [({}, admission["limit"])]),
+        ("model_queue_depth", "gauge", "Requests waiting for a model slot", [({}, admission["queued"])]),
+        ("admission_rejected_total", "counter", "Requests turned away by admission control",
+         [({"reason": "queue_full"}, admission["rejected"]), ({"reason": "wait_timeout"}, admission["timed_out"]),
+          ({"reason": "client_rate"}, admission["client_rejected"])]),
+        ("model_throttled_total", "counter", "Model calls the upstream throttled", [({}, admission["throttled"])]),
+        ("model_retries_total", "counter", "Throttled model calls retried after backoff", [({}, admission["retried"])]),
+    ]
+
+
+registry.register_collector(_solver_metrics)
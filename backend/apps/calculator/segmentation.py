@@ -0,0 +1,110 @@
+"""
+Split a canvas into independent problems
+
+Students often write several unrelated problems on one board. A recursive
+XY cut over the ink mask's projection profiles splits the canvas wherever
+a wide enough band of empty rows or columns separates the ink. Each region
+is then normalized, cached and solved on its own. Editing one problem only
+sends that region back to the model.
+
+Gaps must be wide, both in pixels and relative to the height of the
+written lines, because the regions are solved without seeing each other.
+Lines of work at normal spacing stay in one region, so an assignment and
+the expression that uses it are solved together.
+"""
+
+import math
+from typing import List
+
+import numpy as np
+from PIL import Image
+
+from apps.calculator.preprocess import ContentStats, flatten_alpha, ink_mask, reduce_for_detection
+
+# Empty band, in full-resolution pixels, needed to separate two regions
+MIN_GAP = 80
+
+# Rows must also be this many times as tall as the band's median line, so
+# lines of one piece of work (a system of equations, an assignment and its
+# use) written at normal spacing stay together
+ROW_GAP_RATIO = 3
+
+# Columns must also be this many times as wide as the band they split is tall,
+# so spacing between symbols of one expression is not mistaken for a gap
+COLUMN_GAP_RATIO = 1.5
+
+# Regions holding less than this share of the canvas's ink are stray marks
+MIN_REGION_INK = 0.005
+
+
+def _spans(profile: np.ndarray, min_gap: int) -> list:
+    """[start, end) ranges of inked entries separated by at least min_gap empty ones"""
+    inked = np.flatnonzero(profile)
+    if inked.size == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(inked) > min_gap)
+    starts = np.concatenate(([inked[0]], inked[breaks + 1]))
+    ends = np.concatenate((inked[breaks], [inked[-1]])) + 1
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def _line_height(profile: np.ndarray) -> int:
+    """Median height of the runs of inked rows, i.e. of the written lines"""
+    heights = [end - start for start, end in _spans(profile, 1)]
+    return int(np.median(heights)) if heights else 0
+
+
+def _cut(mask: np.ndarray, top: int, left: int, min_gap: int, cells: list):
+    """Append (top, left, bottom, right, ink) for each cell of mask that no gap splits, in reading order"""
+    profile = mask.any(axis=1)
+    rows = _spans(profile, max(min_gap, math.ceil(ROW_GAP_RATIO * _line_height(profile))))
+    if len(rows) > 1:
+        for start, end in rows:
+            _cut(mask[start:end], top + start, left, min_gap, cells)
+        return
+    if not rows:
+        return
+    start, end = rows[0]
+    mask = mask[start:end]
+    top += start
+    cols = _spans(mask.any(axis=0), max(min_gap, math.ceil(COLUMN_GAP_RATIO * mask.shape[0])))
+    if len(cols) > 1:
+        for col_start, col_end in cols:
+            _cut(mask[:, col_start:col_end], top, left + col_start, min_gap, cells)
+        return
+    col_start, col_end = cols[0]
+    cells.append((top, left + col_start, top + mask.shape[0], left + col_end,
+                  int(np.count_nonzero(mask[:, col_start:col_end]))))
+
+
+def segment_canvas(image: Image.Image, max_regions: int) -> List[ContentStats]:
+    """
+    Content stats for each region of the canvas, in reading order, with
+    bboxes in full-resolution pixels. Returns an empty list when the canvas
+    holds a single problem or splits into more than max_regions pieces,
+    and should be solved whole.
+    """
+    image = flatten_alpha(image)
+    width, height = image.size
+
+    # Same reduced copy and frame inset as detect_content
+    small, factor, inset = reduce_for_detection(image)
+    mask = ink_mask(small)
+
+    cells = []
+    _cut(mask, 0, 0, math.ceil(MIN_GAP / factor), cells)
+    total_ink = sum(cell[4] for cell in cells)
+    cells = [cell for cell in cells if cell[4] >= MIN_REGION_INK * total_ink]
+    if not 1 < len(cells) <= max_regions:
+        return []
+
+    regions = []
+    for top, left, bottom, right, ink in cells:
+        bbox = (
+            min(width, (left + inset) * factor),
+            min(height, (top + inset) * factor),
+            min(width, (right + inset) * factor),
+            min(height, (bottom + inset) * factor),
+        )
+        regions.append(ContentStats(width, height, ink / mask.size, bbox))
+    return regions
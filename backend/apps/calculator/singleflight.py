@@ -0,0 +1,81 @@
+"""
+Single-flight coalescing of identical in-flight solves
+
+When many identical canvases arrive together (a class copying the same
+worked example), the first request for a key starts the model call and
+every later request for that key awaits the same call instead of making
+its own. The shared call runs as its own task, so a disconnecting caller
+never cancels it for the others; once every caller has gone it is left to
+finish, since the model thread cannot be interrupted, and its result
+still reaches the cache.
+"""
+
+import asyncio
+import copy
+from typing import Awaitable, Callable
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._waiters = {}
+        self.reset()
+
+    def reset(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self.abandoned = 0
+
+    async def run(self, key: str, fn: Callable[[], Awaitable]):
+        """
+        Await fn() for key, sharing one call with concurrent callers.
+        Returns (result, shared) where shared is True for callers that
+        joined a call started by someone else.
+        """
+        task = self._calls.get(key)
+        shared = task is not None
+        if shared:
+            self.coalesced += 1
+        else:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            self._waiters[task] = 0
+            task.add_done_callback(lambda done: self._finish(key, done))
+
+        self._waiters[task] += 1
+        try:
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and self._waiters[task] == 1:
+                # Last interested caller left; let the call finish so it is cached
+                self.abandoned += 1
+            raise
+        finally:
+            if task in self._waiters:
+                self._waiters[task] -= 1
+        # Callers must not see each other's mutations
+        return (copy.deepcopy(result) if shared else result), shared
+
+    def in_flight(self, key: str) -> bool:
+        """True when a call for key is running, so run() would join it"""
+        return key in self._calls
+
+    def _finish(self, key: str, task: asyncio.Future):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        self._waiters.pop(task, None)
+        if not task.cancelled():
+            # Mark the exception as retrieved when nobody was left to await it
+            task.exception()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned,
+        }
+
+
+model_flight = SingleFlight()
@@ -0,0 +1,89 @@
+"""
+Incremental parser for streamed model replies
+
+The model answers with a Python-literal list of dicts, or a JSON array
+when structured output is on. While the text is still arriving, this scanner tracks quotes and nesting so it can report
+each top-level result dict, and each entry of a result's 'steps' list,
+as soon as its closing character is seen.
+"""
+
+import ast
+import json
+import re
+
+_STEPS_KEY = re.compile(r"""['"]steps['"]\s*:\s*$""")
+
+
+class IncrementalResultParser:
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._depth = 0            # brace depth; 1 means inside a result dict
+        self._brackets = 0         # bracket depth inside the current result dict
+        self._quote = None
+        self._escape = False
+        self._string_start = 0
+        self._dict_start = None
+        self._steps_depth = None   # bracket depth of the open 'steps' list
+        self.result_index = 0
+
+    def feed(self, chunk: str) -> list:
+        """
+        Consume more text and return the newly completed items as
+        ("step", result_index, step) and ("result", result_index, dict) tuples.
+        """
+        self.text += chunk
+        text = self.text
+        events = []
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._quote:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == self._quote:
+                    self._quote = None
+                    if self._steps_depth is not None and self._depth == 1 and self._brackets == self._steps_depth:
+                        step = _literal(text[self._string_start:i + 1])
+                        if isinstance(step, str):
+                            events.append(("step", self.result_index, step))
+            elif ch in "'\"":
+                self._quote = ch
+                self._string_start = i
+            elif ch == "{":
+                if self._depth == 0:
+                    self._dict_start = i
+                    self._brackets = 0
+                    self._steps_depth = None
+                self._depth += 1
+            elif ch == "}" and self._depth:
+                self._depth -= 1
+                if self._depth == 0 and self._dict_start is not None:
+                    result = _literal(text[self._dict_start:i + 1])
+                    if isinstance(result, dict):
+                        events.append(("result", self.result_index, result))
+                    self.result_index += 1
+                    self._dict_start = None
+            elif ch == "[" and self._depth == 1:
+                self._brackets += 1
+                if self._steps_depth is None and _STEPS_KEY.search(text, self._dict_start, i):
+                    self._steps_depth = self._brackets
+            elif ch == "]" and self._depth == 1:
+                if self._steps_depth == self._brackets:
+                    self._steps_depth = None
+                self._brackets -= 1
+        self._pos = len(text)
+        return events
+
+
+def _literal(source: str):
+    """Parse a completed item as a Python literal, then as JSON; None when neither works"""
+    try:
+        return ast.literal_eval(source)
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        pass
+    try:
+        return json.loads(source)
+    except (ValueError, RecursionError):
+        return None
@@ -0,0 +1,75 @@
+"""
+Startup warmup, run from the app lifespan before the worker accepts traffic
+
+Each step pays a one-off cost that would otherwise land on the first
+requests: rendering every prompt template (and with it the formula index),
+the PIL/numpy paths of the image pipeline, the result cache's SQLite file
+and the model client connections. Nothing here records metrics.
+"""
+
+import io
+import logging
+import time
+
+from PIL import Image, ImageDraw
+
+from apps.calculator.cache import image_hash, make_key, result_cache
+from apps.calculator.formula_retrieval import select_formulas
+from apps.calculator.model import get_model_pool
+from apps.calculator.preprocess import detect_content, flatten_alpha, normalize_image, open_image
+from apps.calculator.prompts import TEMPLATES
+from apps.calculator.response_parser import validate_answer
+from apps.calculator.segmentation import segment_canvas
+from constants import SEGMENT_MAX_REGIONS, WARMUP_MODEL
+
+logger = logging.getLogger(__name__)
+
+
+def _warm_prompts():
+    for (mode, _), template in TEMPLATES.items():
+        template.render({"x": 1}, select_formulas(mode, {"x": 1}))
+
+
+def _warm_image_pipeline():
+    canvas = Image.new("RGBA", (256, 128), (0, 0, 0, 0))
+    ImageDraw.Draw(canvas).line([(40, 64), (216, 64)], fill=(0, 0, 0, 255), width=6)
+    buffer = io.BytesIO()
+    canvas.save(buffer, format="PNG")
+    raw = buffer.getvalue()
+    image = flatten_alpha(open_image(raw))
+    stats = detect_content(image)
+    segment_canvas(image, SEGMENT_MAX_REGIONS)
+    image_hash(normalize_image(image, stats, original_bytes=len(raw)).image)
+
+
+def _warm_cache():
+    # A miss is enough to open the SQLite file and load its schema
+    result_cache.get(make_key("warmup", {}, "warmup", False), track=False)
+
+
+def _warm_model():
+    validate_answer({"expr": "1 + 1", "result": 2}, detailed_steps=True)
+    if WARMUP_MODEL:
+        get_model_pool().warmup()
+
+
+WARMUP_STEPS = (
+    ("prompts", _warm_prompts),
+    ("image pipeline", _warm_image_pipeline),
+    ("result cache", _warm_cache),
+    ("model", _warm_model),
+)
+
+
+def warm_up():
+    """Run every warmup step; a failing step is logged rather than keeping the worker from starting"""
+    start = time.perf_counter()
+    for name, step in WARMUP_STEPS:
+        step_start = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            logger.warning("Warmup step '%s' failed", name, exc_info=True)
+            continue
+        logger.debug("Warmup step '%s' took %.1f ms", name, (time.perf_counter() - step_start) * 1000)
+    logger.info("Warmed up in %.1f ms", (time.perf_counter() - start) * 1000)
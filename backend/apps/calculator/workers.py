@@ -0,0 +1,54 @@
+"""
+Bounded worker pools that keep blocking work off the asyncio event loop
+"""
+
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from constants import IMAGE_WORKERS, MODEL_CONCURRENCY
+
+# Threads rather than processes: PIL and NumPy release the GIL for the heavy
+# lifting, and decoded images would otherwise have to be pickled across.
+_image_pool = None
+_model_pool = None
+
+
+def _get_image_pool() -> ThreadPoolExecutor:
+    global _image_pool
+    if _image_pool is None:
+        _image_pool = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image")
+    return _image_pool
+
+
+def _get_model_pool() -> ThreadPoolExecutor:
+    global _model_pool
+    if _model_pool is None:
+        _model_pool = ThreadPoolExecutor(max_workers=MODEL_CONCURRENCY, thread_name_prefix="model")
+    return _model_pool
+
+
+async def run_image_task(fn, *args, **kwargs):
+    """Run CPU-bound image work (decoding, scanning, resizing) in the image pool"""
+    loop = asyncio.get_running_loop()
+    # Carry the request ID into the worker thread's log records
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_get_image_pool(), partial(context.run, fn, *args, **kwargs))
+
+
+async def run_model_call(fn, *args, **kwargs):
+    """Run a blocking model call in the model pool, at most MODEL_CONCURRENCY at a time"""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_get_model_pool(), partial(context.run, fn, *args, **kwargs))
+
+
+def shutdown_workers():
+    """Stop both pools; they are recreated lazily if used again"""
+    global _image_pool, _model_pool
+    for pool in (_image_pool, _model_pool):
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+    _image_pool = None
+    _model_pool = None
@@ -1,37 +1,40 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Response
 from schema import MathMode, FormulaInfo
-from formula_library import get_formulas_for_mode, get_formula_by_name
-from typing import Dict, List
+from formula_library import formula_index, search_formulas
+from typing import Dict, List, Optional
 
 router = APIRouter()
 
 @router.get('/by-mode/{mode}')
 async def get_formulas_by_mode(mode: MathMode):
     """Get all formulas for a specific math mode"""
-    formulas = get_formulas_for_mode(mode)
-    return {
-        "mode": mode,
-        "formulas": [
-            {
-                "name": data["name"],
-                "formula": data["formula"],
-                "explanation": data["explanation"]
-            }
-            for _, data in formulas.items()
-        ]
-    }
+    # Bodies are serialized once when the formula index is built
+    return Response(content=formula_index.mode_body(mode.value), media_type="application/json")
 
 @router.get('/search/{query}')
-async def search_formula(query: str):
-    """Search for a formula by name"""
-    formula = get_formula_by_name(query)
-    if formula:
+async def search_formula(query: str, limit: int = 10, mode: Optional[MathMode] = None):
+    """Search formulas by name, alias, prefix or explanation, best match first"""
+    results = [
+        {
+            "name": formula["name"],
+            "formula": formula["formula"],
+            "explanation": formula["explanation"],
+            "mode": formula_mode,
+            "score": round(score, 3)
+        }
+        for score, formula_mode, _, formula in search_formulas(
+            query, limit=max(1, min(limit, 100)), mode=mode.value if mode else None
+        )
+    ]
+    if results:
+        best = results[0]
         return {
             "found": True,
             "formula": {
-                "name": formula["name"],
-                "formula": formula["formula"],
-                "explanation": formula["explanation"]
-            }
+                "name": best["name"],
+                "formula": best["formula"],
+                "explanation": best["explanation"]
+            },
+            "results": results
         }
-    return {"found": False}
+    return {"found": False, "results": []}
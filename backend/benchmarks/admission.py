@@ -0,0 +1,87 @@
+"""
+Benchmark: a request spike against an upstream that throttles
+
+The fake model backend accepts only --capacity concurrent calls and
+throttles the rest, like Gemini under load. A burst of distinct clients
+hits POST /calculate, once calling the model directly as the route used
+to and once through admission control. Run from the backend directory:
+    python benchmarks/admission.py [--requests 200] [--capacity 4] [--latency 0.2]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+# The in-process client plays a proxy, so each student's X-Client-ID counts
+os.environ.setdefault("TRUSTED_PROXIES", "127.0.0.1")
+
+from apps.calculator import route
+from apps.calculator.admission import AdmissionController
+from apps.calculator.model import FakeBackend, start_model_pool
+from asgi_client import request, running
+from load_test import RESPONSE, make_payload
+from main import app
+
+
+class PassThrough(AdmissionController):
+    """The old behaviour: every request calls the model straight away"""
+
+    async def call(self, fn):
+        return await fn()
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+
+
+async def spike(payload, total):
+    async def one(i):
+        start = time.perf_counter()
+        body = {**payload, "dict_of_vars": {"spike": i}}
+        try:
+            response = await request(app, "POST", "/calculate", body, {"x-client-id": f"student-{i}"})
+        except Exception:
+            # Unhandled errors are re-raised to the in-process client after the 500 is sent
+            return 500, time.perf_counter() - start
+        return response.status, time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(total)))
+    return results, time.perf_counter() - start
+
+
+async def run_case(name, controller, payload, args):
+    route.model_admission = controller
+    backend = FakeBackend(latency=args.latency, response=RESPONSE, capacity=args.capacity, seed=0)
+    start_model_pool(backend)
+    results, elapsed = await spike(payload, args.requests)
+    ok = [seconds for status, seconds in results if status == 200]
+    shed = sum(1 for status, _ in results if status in (429, 503))
+    failed = len(results) - len(ok) - shed
+    stats = controller.stats()
+    print(f"{name:<12} {len(ok):>4} {shed:>5} {failed:>6} {backend.errors:>9} "
+          f"{percentile(ok, 0.5):>7.2f} {percentile(ok, 0.95):>7.2f} {elapsed:>7.2f} {stats['limit']:>6}")
+
+
+async def main(args):
+    payload = make_payload()
+    print(f"{args.requests} requests, upstream capacity {args.capacity}, latency {args.latency * 1000:.0f} ms")
+    print(f"{'':<12} {'ok':>4} {'shed':>5} {'failed':>6} {'throttled':>9} {'p50 s':>7} {'p95 s':>7} "
+          f"{'total s':>7} {'limit':>6}")
+    async with running(app):
+        await run_case("direct", PassThrough(), payload, args)
+        route.result_cache.clear()
+        await run_case("admission", AdmissionController(), payload, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--capacity", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.2)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,88 @@
+"""
+Minimal in-process ASGI client so benchmarks can drive the FastAPI app
+without a server, a socket or extra dependencies
+"""
+
+import asyncio
+import json
+import os
+import sys
+from contextlib import asynccontextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class Response:
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+
+async def request(app, method, path, body=b"", headers=None, on_chunk=None):
+    """
+    Send a single HTTP request to an ASGI app and collect the full response;
+    on_chunk, if given, is called with each body chunk as it is sent
+    """
+    if isinstance(body, (dict, list)):
+        body = json.dumps(body).encode()
+        headers = {"content-type": "application/json", **(headers or {})}
+    path, _, query = path.partition("?")
+    raw_headers = [(b"content-length", str(len(body)).encode())]
+    raw_headers += [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": raw_headers,
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+    sent = False
+    finished = asyncio.Event()
+    status = None
+    response_headers = {}
+    chunks = []
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # Like a real client, only disconnect once the response is complete
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            response_headers.update((k.decode(), v.decode()) for k, v in message.get("headers", []))
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+            if on_chunk is not None and message.get("body"):
+                on_chunk(message["body"])
+            if not message.get("more_body", False):
+                finished.set()
+
+    try:
+        await app(scope, receive, send)
+    finally:
+        finished.set()
+    return Response(status, response_headers, b"".join(chunks))
+
+
+@asynccontextmanager
+async def running(app):
+    """Run the app's lifespan startup and shutdown around a block"""
+    async with app.router.lifespan_context(app):
+        yield app
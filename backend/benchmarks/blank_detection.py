@@ -0,0 +1,69 @@
+"""
+Benchmark: per-pixel Python loop vs. vectorized content detection
+
+Run from the backend directory:
+    python benchmarks/blank_detection.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw
+
+from apps.calculator.preprocess import detect_content
+
+SIZES = [(400, 300), (800, 600), (1280, 720), (1920, 1080), (3840, 2160)]
+
+
+def legacy_has_content(image: Image.Image) -> bool:
+    """The detection loop the calculate route used before preprocess.detect_content"""
+    if image.mode == 'RGBA':
+        image = image.convert('RGB')
+    pixels = image.load()
+    width, height = image.size
+    non_white_count = 0
+    for y in range(height):
+        for x in range(width):
+            pixel = pixels[x, y]
+            if any(channel < 240 for channel in pixel):
+                non_white_count += 1
+    return non_white_count > (width * height * 0.01)
+
+
+def make_canvas(size, blank=False):
+    image = Image.new('RGBA', size, (255, 255, 255, 255))
+    if not blank:
+        draw = ImageDraw.Draw(image)
+        width, height = size
+        stroke = max(2, width // 200)
+        draw.line((width * 0.2, height * 0.5, width * 0.4, height * 0.5), fill='black', width=stroke)
+        draw.line((width * 0.3, height * 0.35, width * 0.3, height * 0.65), fill='black', width=stroke)
+        draw.ellipse((width * 0.5, height * 0.35, width * 0.7, height * 0.65), outline='red', width=stroke)
+    return image
+
+
+def timed(fn, image, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(image)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    print(f"{'size':>12} {'canvas':>8} {'legacy ms':>12} {'vectorized ms':>14} {'speedup':>9}")
+    for size in SIZES:
+        for blank in (True, False):
+            image = make_canvas(size, blank)
+            legacy = timed(legacy_has_content, image, repeat=1)
+            fast = timed(detect_content, image, repeat=5)
+            label = 'blank' if blank else 'drawn'
+            print(f"{size[0]:>5}x{size[1]:<6} {label:>8} {legacy * 1000:>12.1f} {fast * 1000:>14.2f} {legacy / fast:>8.0f}x")
+
+
+if __name__ == '__main__':
+    main()
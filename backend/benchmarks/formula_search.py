@@ -0,0 +1,109 @@
+"""
+Benchmark: formula lookup and search on a large library
+
+Generates a synthetic library of several thousand formulas as a JSON data
+file, loads it the way FORMULA_LIBRARY_PATH does, and compares the old
+linear scans with the prebuilt FormulaIndex. Run from the backend directory:
+    python benchmarks/formula_search.py [--size 5000]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from formula_library import MODE_TO_FORMULAS, FormulaIndex, load_formulas
+
+SUBJECTS = ["circle", "sphere", "triangle", "polygon", "vector", "matrix", "series", "integral",
+            "derivative", "probability", "variance", "quadratic", "logarithm", "exponential",
+            "binomial", "geometric", "arithmetic", "hyperbolic", "parabola", "ellipse"]
+KINDS = ["area", "volume", "theorem", "identity", "rule", "formula", "law", "expansion", "estimate", "bound"]
+QUERIES = ["Pythagorean", "pythag", "quadratic", "circle area", "ellipse 42", "variance bound", "logarithim",
+           "pythagorean_theorem", "standard deviation", "no such thing"]
+
+
+def make_library(size: int) -> dict:
+    rng = random.Random(0)
+    library = {mode: dict(formulas) for mode, formulas in MODE_TO_FORMULAS.items()}
+    modes = list(library)
+    for i in range(size):
+        subject, kind = rng.choice(SUBJECTS), rng.choice(KINDS)
+        key = f"{subject}_{kind}_{i}"
+        library[modes[i % len(modes)]][key] = {
+            "name": f"{subject.title()} {kind.title()} {i}",
+            "formula": f"f_{{{i}}}(x) = x^{{{i % 7}}}",
+            "explanation": f"A {kind} about the {subject} used in exercise {i} of the {rng.choice(SUBJECTS)} chapter",
+        }
+    return library
+
+
+def legacy_by_name(library, name):
+    for formulas in library.values():
+        if name in formulas:
+            return formulas[name]
+    return None
+
+
+def legacy_search(library, query):
+    """Best-effort equivalent of ranked search with linear scans: substring match on names"""
+    query = query.lower()
+    return [data for formulas in library.values() for data in formulas.values()
+            if query in data["name"].lower() or query in data["explanation"].lower()]
+
+
+def legacy_mode_body(library, mode):
+    return json.dumps({"mode": mode, "formulas": [
+        {"name": d["name"], "formula": d["formula"], "explanation": d["explanation"]}
+        for d in library[mode].values()
+    ]}).encode()
+
+
+def per_call_us(fn, number=200):
+    start = time.perf_counter()
+    for _ in range(number):
+        fn()
+    return (time.perf_counter() - start) / number * 1e6
+
+
+def main(args):
+    library = make_library(args.size)
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump(library, f)
+        path = f.name
+    try:
+        start = time.perf_counter()
+        loaded = load_formulas(path)
+        load_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        index = FormulaIndex(loaded)
+        build_ms = (time.perf_counter() - start) * 1000
+    finally:
+        os.unlink(path)
+
+    total = sum(len(formulas) for formulas in loaded.values())
+    print(f"{total} formulas: load {load_ms:.0f} ms, index build {build_ms:.0f} ms")
+    print(f"{'query':<22} {'scan us':>9} {'index us':>9} {'hits':>5}  top result")
+    for query in QUERIES:
+        scan = per_call_us(lambda: legacy_search(loaded, query), number=20)
+        fast = per_call_us(lambda: index.search(query))
+        results = index.search(query)
+        top = results[0][3]["name"] if results else "-"
+        print(f"{query:<22} {scan:>9.0f} {fast:>9.1f} {len(results):>5}  {top}")
+
+    name_scan = per_call_us(lambda: legacy_by_name(loaded, "no_such_formula"))
+    name_index = per_call_us(lambda: index.lookup("no_such_formula"))
+    print(f"exact lookup miss: scan {name_scan:.2f} us, index {name_index:.2f} us")
+    body_old = per_call_us(lambda: legacy_mode_body(loaded, "geometry"), number=20)
+    body_new = per_call_us(lambda: index.mode_body("geometry"))
+    print(f"by-mode body: rebuild {body_old:.0f} us, pre-serialized {body_new:.2f} us")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=5000, help="number of synthetic formulas")
+    main(parser.parse_args())
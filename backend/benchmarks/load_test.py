@@ -0,0 +1,82 @@
+"""
+Load test: POST /calculate throughput as concurrent clients increase
+
+Gemini is replaced by the fake model backend with a fixed latency, so the numbers
+show how well the route keeps the event loop free while model calls and
+image work are in flight. Run from the backend directory:
+    python benchmarks/load_test.py [--latency 0.2] [--requests 32]
+"""
+
+import argparse
+import asyncio
+import base64
+import itertools
+import os
+import sys
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Keep the route's logging out of the report, and let one process act as many clients
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+os.environ.setdefault("CLIENT_RATE", "0")
+
+from PIL import Image, ImageDraw
+
+from apps.calculator.model import FakeBackend, start_model_pool
+from asgi_client import request, running
+from constants import IMAGE_WORKERS, MODEL_CONCURRENCY
+from main import app
+
+CLIENTS = [1, 2, 4, 8, 16, 32]
+REQUEST_IDS = itertools.count()
+
+# An answer the local solver cannot replay, so every request reaches the model
+RESPONSE = "[{'expr': 'a heart drawn in red', 'result': 'love'}]"
+
+
+def make_payload():
+    image = Image.new('RGBA', (1280, 720), (255, 255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    draw.text((200, 300), "2 + 3 * 4", fill='black', font_size=120)
+    buffer = BytesIO()
+    image.save(buffer, format='PNG')
+    data_url = "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+    return {"image": data_url, "dict_of_vars": {}, "mode": "basic", "detailed_steps": False}
+
+
+async def client(payload, count):
+    for _ in range(count):
+        # Unique vars per request so the result cache never answers
+        body = {**payload, "dict_of_vars": {"request": next(REQUEST_IDS)}}
+        response = await request(app, "POST", "/calculate", body)
+        assert response.status == 200, response.body
+
+
+async def measure(payload, clients, total):
+    per_client = max(1, total // clients)
+    start = time.perf_counter()
+    await asyncio.gather(*(client(payload, per_client) for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    return per_client * clients / elapsed
+
+
+async def main(args):
+    payload = make_payload()
+    print(f"stub latency {args.latency * 1000:.0f} ms, "
+          f"IMAGE_WORKERS={IMAGE_WORKERS}, MODEL_CONCURRENCY={MODEL_CONCURRENCY}")
+    print(f"{'clients':>8} {'req/s':>8} {'speedup':>8}")
+    async with running(app):
+        start_model_pool(FakeBackend(latency=args.latency, response=RESPONSE))
+        baseline = None
+        for clients in CLIENTS:
+            throughput = await measure(payload, clients, args.requests)
+            baseline = baseline or throughput
+            print(f"{clients:>8} {throughput:>8.1f} {throughput / baseline:>7.1f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--latency', type=float, default=0.2, help="stub model latency in seconds")
+    parser.add_argument('--requests', type=int, default=32, help="requests per concurrency level")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,91 @@
+"""
+Benchmark: upload size and cost of the image normalization pipeline
+
+For each sample canvas this compares the PNG the frontend sends, the JPEG
+the Gemini SDK would have produced from the raw canvas, and the
+normalized PNG that is sent now. Run from the backend directory:
+    python benchmarks/normalize_images.py
+"""
+
+import os
+import sys
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw
+
+from apps.calculator.preprocess import detect_content, flatten_alpha, normalize_image
+
+
+def expression(size, text, position, font_size, color='black'):
+    image = Image.new('RGBA', size, (255, 255, 255, 255))
+    ImageDraw.Draw(image).text(position, text, fill=color, font_size=font_size)
+    return image
+
+
+def selection(size):
+    image = expression(size, "x^2 + 2x + 1 = 0", (20, size[1] // 3), 48)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, size[0] - 1, size[1] - 1), outline='black', width=2)
+    return image
+
+
+def diagram(size):
+    image = Image.new('RGBA', size, (255, 255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    draw.polygon([(300, 800), (1100, 800), (300, 250)], outline='black', width=6)
+    draw.text((650, 820), "a = 3", fill='#228be6', font_size=60)
+    draw.text((150, 500), "b = 4", fill='#ee3333', font_size=60)
+    draw.text((750, 450), "c = ?", fill='#40c057', font_size=60)
+    return image
+
+
+def worksheet(size):
+    image = Image.new('RGBA', size, (255, 255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    for row in range(8):
+        draw.text((80, 60 + row * 120), f"{row + 2} * {row + 7} - {row} =", fill='black', font_size=72)
+    return image
+
+
+SAMPLES = [
+    ("selection 600x200", selection((600, 200))),
+    ("small expr on 1920x1080", expression((1920, 1080), "2 + 3 * 4", (700, 450), 96)),
+    ("colored diagram 1920x1080", diagram((1920, 1080))),
+    ("dense worksheet 1920x1080", worksheet((1920, 1080))),
+    ("small expr on 3840x2160", expression((3840, 2160), "∫ x dx", (1500, 1000), 160)),
+]
+
+
+def png_bytes(image):
+    buffer = BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def legacy_upload_bytes(image):
+    """What google.generativeai's pil_to_blob sent for the RGB canvas (JPEG)"""
+    buffer = BytesIO()
+    image.convert('RGB').save(buffer, format='JPEG')
+    return len(buffer.getvalue())
+
+
+def main():
+    print(f"{'sample':<28} {'request':>9} {'old upload':>11} {'new upload':>11} {'saved':>7} {'size':>11} {'mode':>4} {'ms':>7}")
+    for name, canvas in SAMPLES:
+        raw = png_bytes(canvas)
+        start = time.perf_counter()
+        image = flatten_alpha(Image.open(BytesIO(raw)))
+        normalized = normalize_image(image, detect_content(image), original_bytes=len(raw))
+        elapsed = time.perf_counter() - start
+        old = legacy_upload_bytes(image)
+        saved = 1 - len(normalized.data) / old
+        size = f"{normalized.image.width}x{normalized.image.height}"
+        print(f"{name:<28} {len(raw):>9} {old:>11} {len(normalized.data):>11} {saved:>6.0%} "
+              f"{size:>11} {normalized.image.mode:>4} {elapsed * 1000:>7.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Benchmark: prompt size with relevance-ranked formulas
+
+Compares the prompt that embeds every formula of the mode with the one
+carrying only the formulas selected for the request, on the built-in
+library and on a large synthetic one. Run from the backend directory:
+    python benchmarks/prompt_size.py [--size 2000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from apps.calculator.formula_retrieval import CHARS_PER_TOKEN, FormulaRetriever
+from apps.calculator.prompts import get_template
+from formula_library import MODE_TO_FORMULAS
+from formula_search import make_library
+from schema import MathMode
+
+CASES = [
+    (MathMode.GEOMETRY, {"r": 3}, "\\pi r^2"),
+    (MathMode.ALGEBRA, {"a": 1, "b": -3, "c": 2}, "ax^2 + bx + c = 0"),
+    (MathMode.CALCULUS, {}, "\\int x^2 dx"),
+    (MathMode.STATISTICS, {"n": 10, "k": 3, "p": 0.5}, "binomial probability"),
+    (MathMode.BASIC, {}, "2 + 3 * 4"),
+]
+
+
+def full_formulas(library, mode):
+    formulas = {
+        key: {"name": d["name"], "formula": d["formula"], "explanation": d["explanation"]}
+        for key, d in library[mode.value].items()
+    }
+    return json.dumps(formulas, ensure_ascii=False) if formulas else "{}"
+
+
+def report(title, library):
+    retriever = FormulaRetriever(library)
+    print(title)
+    print(f"{'mode':<11} {'full tokens':>11} {'ranked tokens':>13} {'saved':>6} {'select us':>9}")
+    for mode, dict_of_vars, hint in CASES:
+        template = get_template(mode, False)
+        full = template.render(dict_of_vars, full_formulas(library, mode))
+        query = " ".join([*dict_of_vars, hint])
+        start = time.perf_counter()
+        for _ in range(100):
+            selected = retriever.select(mode.value, query)
+        select_us = (time.perf_counter() - start) / 100 * 1e6
+        ranked = template.render(dict_of_vars, selected)
+        full_tokens, ranked_tokens = len(full) // CHARS_PER_TOKEN, len(ranked) // CHARS_PER_TOKEN
+        print(f"{mode.value:<11} {full_tokens:>11} {ranked_tokens:>13} "
+              f"{1 - ranked_tokens / full_tokens:>6.0%} {select_us:>9.1f}")
+    print()
+
+
+def main(args):
+    report("Built-in library", MODE_TO_FORMULAS)
+    report(f"Synthetic library (+{args.size} formulas)", make_library(args.size))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=2000)
+    main(parser.parse_args())
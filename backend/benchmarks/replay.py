@@ -0,0 +1,310 @@
+"""
+Benchmark: replay a corpus of canvases through the whole app, offline
+
+Each corpus entry is one POST /calculate request (canvas, vars, mode,
+steps flag) plus the reply the model gave for it. Entries are replayed
+in-process through the FastAPI app against the fake model backend, which
+answers each canvas with its recorded reply after a latency drawn from a
+configurable distribution. For every concurrency level the run reports
+client-side p50/p95/p99 latency, throughput, errors, which solver tier
+answered and the mean time per pipeline stage, each the median of
+--runs repeats.
+
+No network is needed. Run from the backend directory:
+    python benchmarks/replay.py [--size 60] [--concurrency 1,4,16] [--latency lognormal:0.8,0.4]
+    python benchmarks/replay.py --write-corpus corpus.jsonl --size 200
+    python benchmarks/replay.py --corpus corpus.jsonl --json run.json --baseline previous.json
+
+A corpus is a JSONL file of {"image", "dict_of_vars", "mode",
+"detailed_steps", "response"} objects, where image is a data URL. With
+--baseline the run fails when p95 latency, or a CPU stage at concurrency
+1, regressed by more than --tolerance and by more than an absolute floor.
+CPU stages are only compared at concurrency 1: under load their wall time
+also counts waiting on the GIL and the worker pools.
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+os.environ.setdefault("CLIENT_RATE", "0")
+
+from PIL import Image, ImageDraw
+
+from apps.calculator.cache import result_cache
+from apps.calculator.local_solver import tier_stats
+from apps.calculator.model import FakeBackend, start_model_pool
+from apps.calculator.route import prepare_image
+from asgi_client import request, running
+from main import app
+from observability import STAGE_SECONDS
+
+STEPS = "'steps': ['Identify the operation', 'Apply it', 'State the result'], 'formulas_used': []"
+
+# (text on the canvas, mode, vars, model reply, reply with steps)
+PROBLEMS = [
+    ("2 + 3 * 4", "basic", {}, "[{'expr': '2 + 3 * 4', 'result': 14}]",
+     "[{'expr': '2 + 3 * 4', 'result': 14, " + STEPS + "}]"),
+    ("x = 4", "basic", {}, "[{'expr': 'x', 'result': 4, 'assign': True}]",
+     "[{'expr': 'x', 'result': 4, 'assign': True, " + STEPS + "}]"),
+    ("x^2 - 5x + 6 = 0", "algebra", {},
+     "```python\n[{'expr': 'x', 'result': 2, 'assign': True}, {'expr': 'x', 'result': 3, 'assign': True}]\n```",
+     "```python\n[{'expr': 'x', 'result': 2, 'assign': True, " + STEPS + "}]\n```"),
+    ("3y + 4 = x", "algebra", {"x": 10}, "[{'expr': '3y + 4 = 10', 'result': 2, 'assign': True}]",
+     "[{'expr': '3y + 4 = 10', 'result': 2, 'assign': True, " + STEPS + "}]"),
+    ("A = πr², r = 3", "geometry", {"r": 3}, '[{"expr": "\\\\pi r^2", "result": 28.27, "assign": false}]',
+     '[{"expr": "\\\\pi r^2", "result": 28.27, "steps": ["A = pi * 3^2", "A = 28.27"]}]'),
+    ("∫ 2x dx", "calculus", {}, "[{'expr': '\\\\int 2x dx', 'result': 'x^2 + C'}]",
+     "[{'expr': '\\\\int 2x dx', 'result': 'x^2 + C', " + STEPS + "}]"),
+    ("mean 2 4 9", "statistics", {}, "Here is the answer: [{'expr': 'mean(2, 4, 9)', 'result': 5}]",
+     "[{'expr': 'mean(2, 4, 9)', 'result': 5, " + STEPS + "}]"),
+    ("♥", "basic", {}, "[{'expr': 'a heart drawn in red', 'result': 'love'}]",
+     "[{'expr': 'a heart drawn in red', 'result': 'love', " + STEPS + "}]"),
+]
+
+CANVAS_SIZES = [(1280, 720), (1920, 1080), (800, 600)]
+
+DEFAULT_RESPONSE = "[{'expr': 'unknown', 'result': 'unknown'}]"
+
+
+def _data_url(image: Image.Image) -> str:
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+def make_corpus(size: int, seed: int = 0) -> list:
+    """A synthetic stand-in for a recorded corpus: varied canvases, modes and reply shapes"""
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(size):
+        text, mode, dict_of_vars, response, steps_response = rng.choice(PROBLEMS)
+        width, height = rng.choice(CANVAS_SIZES)
+        image = Image.new("RGBA", (width, height), (255, 255, 255, 255))
+        draw = ImageDraw.Draw(image)
+        # Roughly one canvas in twenty is submitted blank
+        if rng.random() > 0.05:
+            color = rng.choice(["black", "black", "#ee3333", "#228be6"])
+            draw.text((rng.randrange(20, width // 2), rng.randrange(20, height // 2)), text,
+                      fill=color, font_size=rng.choice([48, 72, 96]))
+        detailed_steps = rng.random() < 0.3
+        corpus.append({
+            "image": _data_url(image),
+            "dict_of_vars": dict(dict_of_vars),
+            "mode": mode,
+            "detailed_steps": detailed_steps,
+            "response": steps_response if detailed_steps else response,
+        })
+    return corpus
+
+
+def load_corpus(path: str) -> list:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_corpus(path: str, corpus: list):
+    with open(path, "w") as f:
+        for entry in corpus:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def latency_sampler(spec: str, seed: int = 0):
+    """Parse fixed:S, uniform:LO,HI, lognormal:MEDIAN,SIGMA or exp:MEAN into a sampling function"""
+    rng = random.Random(seed)
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: rng.uniform(values[0], values[1])
+    if kind == "lognormal":
+        return lambda: rng.lognormvariate(math.log(values[0]), values[1])
+    if kind == "exp":
+        return lambda: rng.expovariate(1 / values[0])
+    raise ValueError(f"Unknown latency distribution '{spec}'")
+
+
+def make_responder(corpus: list):
+    """Answer each canvas with its recorded reply, looked up by the normalized image the model receives"""
+    replies = {}
+    for entry in corpus:
+        normalized, stats, _ = prepare_image(entry["image"])
+        if normalized is not None:
+            replies[hashlib.sha256(normalized.data).digest()] = entry.get("response") or DEFAULT_RESPONSE
+
+    def respond(contents):
+        part = contents[1]
+        data = part.get("data") if isinstance(part, dict) else None
+        return replies.get(hashlib.sha256(data).digest(), DEFAULT_RESPONSE) if data else DEFAULT_RESPONSE
+
+    return respond
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, math.ceil(fraction * len(values)) - 1))]
+
+
+async def replay(corpus: list, concurrency: int) -> dict:
+    result_cache.clear()
+    tier_stats.reset()
+    stages_before = STAGE_SECONDS.totals()
+    pending = asyncio.Queue()
+    for entry in corpus:
+        pending.put_nowait(entry)
+    latencies = []
+    errors = 0
+
+    async def client():
+        nonlocal errors
+        while not pending.empty():
+            entry = pending.get_nowait()
+            body = {key: entry[key] for key in ("image", "dict_of_vars", "mode", "detailed_steps")}
+            start = time.perf_counter()
+            try:
+                response = await request(app, "POST", "/calculate", body)
+                ok = response.status == 200
+            except Exception:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    stages = {}
+    for key, (count, total) in STAGE_SECONDS.totals().items():
+        before_count, before_total = stages_before.get(key, (0, 0.0))
+        if count > before_count:
+            stages[key[0]] = (total - before_total) / (count - before_count) * 1000
+    return {
+        "concurrency": concurrency,
+        "requests": len(corpus),
+        "errors": errors,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "tiers": {tier: values["hits"] for tier, values in tier_stats.snapshot().items()},
+        "stage_ms": stages,
+    }
+
+
+STAGE_ORDER = ["base64_decode", "image_decode", "blank_check", "normalize", "prompt_build",
+               "model_call", "parse", "postprocess"]
+
+# Stages that do not depend on the fake model's latency, checked against a baseline
+CPU_STAGES = [stage for stage in STAGE_ORDER if stage != "model_call"]
+
+
+def median_result(runs: list) -> dict:
+    """Combine repeated runs of one concurrency level into their median"""
+    combined = dict(runs[-1])
+    for key in ("throughput", "p50_ms", "p95_ms", "p99_ms"):
+        combined[key] = statistics.median(r[key] for r in runs)
+    combined["errors"] = max(r["errors"] for r in runs)
+    stages = {stage for r in runs for stage in r["stage_ms"]}
+    combined["stage_ms"] = {stage: statistics.median(r["stage_ms"].get(stage, 0.0) for r in runs) for stage in stages}
+    combined["runs"] = len(runs)
+    return combined
+
+
+def print_report(results: list):
+    print(f"{'conc':>4} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6}  tiers")
+    for r in results:
+        tiers = " ".join(f"{tier}={hits}" for tier, hits in r["tiers"].items() if hits)
+        print(f"{r['concurrency']:>4} {r['throughput']:>7.1f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} "
+              f"{r['p99_ms']:>8.1f} {r['errors']:>6}  {tiers}")
+    print()
+    print("mean ms per stage")
+    print(f"{'conc':>4} " + " ".join(f"{stage[:12]:>12}" for stage in STAGE_ORDER))
+    for r in results:
+        print(f"{r['concurrency']:>4} " + " ".join(f"{r['stage_ms'].get(stage, 0.0):>12.2f}" for stage in STAGE_ORDER))
+
+
+def regressions(results: list, baseline: list, tolerance: float, min_p95_ms: float, min_stage_ms: float) -> list:
+    """
+    Describe every p95, or CPU-stage mean at concurrency 1, that got worse
+    than the baseline by more than tolerance and by at least the minimum
+    absolute change
+    """
+    previous = {r["concurrency"]: r for r in baseline}
+    problems = []
+    for r in results:
+        before = previous.get(r["concurrency"])
+        if before is None:
+            continue
+        checks = [("p95_ms", r["p95_ms"], before["p95_ms"], min_p95_ms)]
+        if r["concurrency"] == 1:
+            checks += [(f"stage {stage}", r["stage_ms"].get(stage, 0.0), before["stage_ms"].get(stage, 0.0),
+                        min_stage_ms) for stage in CPU_STAGES]
+        for name, now, then, min_change in checks:
+            if now > then * (1 + tolerance) and now - then >= min_change:
+                problems.append(f"concurrency {r['concurrency']}: {name} {then:.2f} -> {now:.2f} ms")
+    return problems
+
+
+async def main(args):
+    corpus = load_corpus(args.corpus) if args.corpus else make_corpus(args.size, args.seed)
+    if args.write_corpus:
+        save_corpus(args.write_corpus, corpus)
+        print(f"Wrote {len(corpus)} entries to {args.write_corpus}")
+        return 0
+
+    backend = FakeBackend(latency=latency_sampler(args.latency, args.seed), response=make_responder(corpus))
+    levels = [int(level) for level in args.concurrency.split(",")]
+    print(f"{len(corpus)} requests per level, median of {args.runs} runs, model latency {args.latency}")
+    results = []
+    async with running(app):
+        start_model_pool(backend)
+        for level in levels:
+            results.append(median_result([await replay(corpus, level) for _ in range(args.runs)]))
+    print_report(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = regressions(results, json.load(f), args.tolerance, args.min_p95_ms, args.min_stage_ms)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", help="JSONL corpus to replay instead of a generated one")
+    parser.add_argument("--write-corpus", help="write the generated corpus to this path and exit")
+    parser.add_argument("--size", type=int, default=60, help="entries in the generated corpus")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--concurrency", default="1,4,16")
+    parser.add_argument("--latency", default="lognormal:0.8,0.4",
+                        help="fixed:S, uniform:LO,HI, lognormal:MEDIAN,SIGMA or exp:MEAN, in seconds")
+    parser.add_argument("--json", help="write the results to this path")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to check for regressions")
+    parser.add_argument("--runs", type=int, default=3, help="repeats per concurrency level; the median is reported")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--min-p95-ms", type=float, default=50.0,
+                        help="smallest p95 increase, in ms, that counts as a regression")
+    parser.add_argument("--min-stage-ms", type=float, default=1.0,
+                        help="smallest stage mean increase, in ms, that counts as a regression")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,92 @@
+"""
+Benchmark: parsing model replies
+
+Runs a corpus of reply shapes seen from the model (clean literals, code
+fences, JSON, prose around the list, truncated lists, bad fields) through
+the old regex + ast.literal_eval parser and the response_parser module,
+and reports how many answers each recovers and the cost per reply.
+Run from the backend directory:
+    python benchmarks/response_parsing.py [--repeat 2000]
+"""
+
+import argparse
+import ast
+import logging
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from apps.calculator.response_parser import parse_answers, parse_stats
+
+STEPS = "'steps': ['Multiply 3 * 4 = 12', 'Add 2 + 12 = 14'], 'formulas_used': []"
+
+# (name, reply, number of answers a correct parser should return)
+CORPUS = [
+    ("clean", "[{'expr': '2 + 3 * 4', 'result': 14}]", 1),
+    ("clean steps", "[{'expr': '2 + 3 * 4', 'result': 14, " + STEPS + "}]", 1),
+    ("two assigns", "[{'expr': 'x', 'result': 2, 'assign': True}, {'expr': 'y', 'result': 5, 'assign': True}]", 2),
+    ("python fence", "```python\n[{'expr': '2 + 2', 'result': 4}]\n```", 1),
+    ("json fence", "```json\n[{\"expr\": \"x\", \"result\": 3, \"assign\": true}]\n```", 1),
+    ("json", "[{\"expr\": \"\\\\frac{1}{2}\", \"result\": 0.5, \"assign\": false}]", 1),
+    ("mixed quotes", "[{'expr': 'x', 'result': 3, 'assign': true}]", 1),
+    ("prose around", "Here is the answer:\n[{'expr': '9 / 3', 'result': 3}]\nLet me know if you need more.", 1),
+    ("bare dict", "{'expr': 'love', 'result': 'Abstract concept: affection'}", 1),
+    ("truncated", "[{'expr': 'x', 'result': 2, 'assign': True}, {'expr': 'y', 'result': 5, 'ass", 1),
+    ("unclosed fence", "```python\n[{'expr': '7 - 8', 'result': -1}]", 1),
+    ("missing result", "[{'expr': '1 + 1'}, {'expr': '2 + 2', 'result': 4}]", 1),
+    ("bad steps", "[{'expr': '6 * 7', 'result': 42, 'steps': 'multiply'}]", 1),
+    ("numeric expr", "[{'expr': 42, 'result': 42}]", 1),
+    ("unicode", "[{'expr': '√16 × 2', 'result': 8, 'steps': ['√16 = 4', '4 × 2 = 8']}]", 1),
+    ("refusal", "I'm sorry, I can't read this image.", 0),
+]
+
+
+def legacy_parse(text):
+    answers = []
+    try:
+        response_text = text.strip()
+        response_text = re.sub(r'```(python|json)?\s*', '', response_text)
+        response_text = re.sub(r'\s*```\s*', '', response_text)
+        answers = ast.literal_eval(response_text)
+    except Exception:
+        pass
+    try:
+        # The old standardization step crashes on anything that is not a list of dicts
+        return [answer for answer in answers if isinstance(answer, dict) and "result" in answer]
+    except TypeError:
+        return []
+
+
+def per_call_us(fn, text, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        fn(text)
+    return (time.perf_counter() - start) / number * 1e6
+
+
+def main(args):
+    # Failed and partial parses log a warning each time
+    logging.disable(logging.WARNING)
+    print(f"{'reply':<15} {'expected':>8} {'legacy':>6} {'parser':>6} {'legacy us':>9} {'parser us':>9}")
+    totals = [0, 0, 0]
+    for name, text, expected in CORPUS:
+        new = parse_answers(text, detailed_steps=True)
+        new_us = per_call_us(lambda t: parse_answers(t, detailed_steps=True), text, args.repeat)
+        old = legacy_parse(text)
+        old_us = per_call_us(legacy_parse, text, args.repeat)
+        totals[0] += expected
+        totals[1] += min(len(old), expected)
+        totals[2] += min(len(new), expected)
+        print(f"{name:<15} {expected:>8} {len(old):>6} {len(new):>6} {old_us:>9.1f} {new_us:>9.1f}")
+    print(f"\nanswers recovered: legacy {totals[1]}/{totals[0]}, parser {totals[2]}/{totals[0]}")
+    stats = parse_stats.snapshot()
+    print(f"parser outcomes: {stats['outcomes']}, failure rate {stats['failure_rate']:.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=2000)
+    main(parser.parse_args())
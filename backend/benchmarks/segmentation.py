@@ -0,0 +1,107 @@
+"""
+Benchmark: solving a canvas with several problems whole vs per region
+
+A canvas holds four separate problems; the student then adds a fifth.
+Both versions are sent to POST /calculate with segmentation off and on.
+The fake model's latency grows with the pixels it is sent, like image
+input tokens do, so a whole-canvas call costs more than a call for one
+region. The fake answers one problem per call. Run from the backend
+directory:
+    python benchmarks/segmentation.py [--latency 0.3] [--per-mpixel 1.0]
+"""
+
+import argparse
+import asyncio
+import base64
+import os
+import sys
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+os.environ.setdefault("CLIENT_RATE", "0")
+
+from PIL import Image, ImageDraw
+
+from apps.calculator import route
+from apps.calculator.model import FakeBackend, start_model_pool
+from apps.calculator.preprocess import flatten_alpha, open_image
+from apps.calculator.segmentation import segment_canvas
+from asgi_client import request, running
+from load_test import RESPONSE
+from main import app
+
+PROBLEMS = [((120, 120), "12 + 7"), ((900, 120), "3 * 4 - 5"), ((120, 520), "81 / 9"), ((900, 520), "2 ^ 5")]
+ADDED = ((500, 860), "x + 1 = 4")
+
+
+class SizedBackend(FakeBackend):
+    """Fake model whose latency is a base cost plus a cost per megapixel of image"""
+
+    def __init__(self, latency, per_mpixel):
+        super().__init__(response=RESPONSE)
+        self.base_latency = latency
+        self.per_mpixel = per_mpixel
+        self.bytes_sent = 0
+
+    def reply(self, contents):
+        part = next(item for item in contents if isinstance(item, dict))
+        self.bytes_sent += len(part["data"])
+        width, height = open_image(part["data"]).size
+        time.sleep(self.base_latency + self.per_mpixel * width * height / 1e6)
+        return super().reply(contents)
+
+
+def make_canvas(problems):
+    image = Image.new("RGBA", (1600, 1000), (255, 255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    for position, text in problems:
+        draw.text(position, text, fill="black", font_size=90)
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def as_payload(raw):
+    data_url = "data:image/png;base64," + base64.b64encode(raw).decode()
+    return {"image": data_url, "dict_of_vars": {}, "mode": "basic", "detailed_steps": False}
+
+
+async def run_case(name, segmentation, canvases, args):
+    route.CANVAS_SEGMENTATION = segmentation
+    route.result_cache.clear()
+    for step, raw in canvases:
+        backend = SizedBackend(args.latency, args.per_mpixel)
+        start_model_pool(backend)
+        start = time.perf_counter()
+        response = await request(app, "POST", "/calculate", as_payload(raw))
+        elapsed = time.perf_counter() - start
+        assert response.status == 200, response.body
+        answers = len(response.json()["data"])
+        print(f"{name:<10} {step:<8} {answers:>7} {backend.calls:>6} {backend.bytes_sent:>8} {elapsed:>7.2f}")
+
+
+async def main(args):
+    first = make_canvas(PROBLEMS)
+    edited = make_canvas(PROBLEMS + [ADDED])
+    # The route segments the already flattened canvas
+    image = flatten_alpha(open_image(edited))
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        regions = segment_canvas(image, route.SEGMENT_MAX_REGIONS)
+    print(f"segment_canvas: {len(regions)} regions, {(time.perf_counter() - start) / args.repeat * 1000:.2f} ms")
+    print(f"model latency {args.latency * 1000:.0f} ms + {args.per_mpixel * 1000:.0f} ms per megapixel\n")
+    print(f"{'':<10} {'canvas':<8} {'answers':>7} {'calls':>6} {'bytes':>8} {'s':>7}")
+    async with running(app):
+        canvases = [("first", first), ("edited", edited)]
+        await run_case("whole", False, canvases, args)
+        await run_case("regions", True, canvases, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--per-mpixel", type=float, default=1.0)
+    parser.add_argument("--repeat", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,64 @@
+"""
+Benchmark: time to first answer for POST /calculate vs. /calculate/stream
+
+Uses the fake model backend, which streams its canned reply in chunks
+spread over the configured latency. Run from the backend directory:
+    python benchmarks/stream_latency.py [--latency 3.0]
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+os.environ.setdefault("CLIENT_RATE", "0")
+
+from apps.calculator.cache import result_cache
+from apps.calculator.model import FakeBackend, start_model_pool
+from asgi_client import request, running
+from load_test import make_payload
+from main import app
+
+STEPS = [f"Step {i}: simplify the expression using rule number {i} and carry the result forward" for i in range(1, 9)]
+RESPONSE = repr([{"expr": "2 + 3 * 4", "result": 14, "steps": STEPS, "formulas_used": []}])
+REQUEST_IDS = itertools.count()
+
+
+async def timed(path, payload):
+    marks = {}
+    start = time.perf_counter()
+
+    def on_chunk(chunk):
+        now = time.perf_counter() - start
+        marks.setdefault("first", now)
+        if b"event: result" in chunk:
+            marks.setdefault("result", now)
+
+    await request(app, "POST", path, payload, on_chunk=on_chunk)
+    marks["total"] = time.perf_counter() - start
+    return marks
+
+
+async def main(args):
+    payload = {**make_payload(), "detailed_steps": True}
+    print(f"fake latency {args.latency:.1f}s, {len(STEPS)} steps, {len(RESPONSE)} chars")
+    print(f"{'endpoint':<18} {'first byte s':>13} {'first result s':>15} {'total s':>8}")
+    async with running(app):
+        start_model_pool(FakeBackend(latency=args.latency, response=RESPONSE, chunk_size=24))
+        for path in ("/calculate", "/calculate/stream"):
+            body = {**payload, "dict_of_vars": {"request": next(REQUEST_IDS)}}
+            # Otherwise the second endpoint is answered from the first one's result
+            result_cache.clear()
+            marks = await timed(path, body)
+            first_result = marks.get("result", marks["total"])
+            print(f"{path:<18} {marks['first']:>13.2f} {first_result:>15.2f} {marks['total']:>8.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--latency', type=float, default=3.0, help="fake model generation time in seconds")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,78 @@
+"""
+Benchmark: JSON data-URL uploads vs. raw image bytes
+
+Compares request size, parse time (body -> decoded PIL image) and peak
+Python memory during parsing (tracemalloc; PIL's own pixel buffers are
+the same for both paths and not counted) for POST /calculate and /calculate/upload.
+Run from the backend directory:
+    python benchmarks/upload_path.py
+"""
+
+import base64
+import json
+import os
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+
+from apps.calculator.preprocess import decode_data_url, open_image
+from schema import ImageData
+
+SIZES = [(600, 200), (1280, 720), (1920, 1080), (3840, 2160)]
+
+
+def make_png(size):
+    # Noisy strokes so PNG compression does not hide the payload difference
+    rng = np.random.default_rng(0)
+    pixels = np.full((size[1], size[0], 4), 255, dtype=np.uint8)
+    rows = rng.integers(0, size[1], size=size[1] // 4)
+    pixels[rows, :, :3] = rng.integers(0, 255, size=(rows.size, size[0], 3), dtype=np.uint8)
+    buffer = BytesIO()
+    Image.fromarray(pixels, 'RGBA').save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def parse_json(body: bytes):
+    """What FastAPI and the route do for POST /calculate"""
+    data = ImageData(**json.loads(body))
+    return open_image(decode_data_url(data.image))
+
+
+def parse_raw(body: bytes):
+    """What the route does for POST /calculate/upload"""
+    return open_image(body)
+
+
+def measure(fn, body, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(body)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    fn(body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def main():
+    print(f"{'size':>10} {'path':>5} {'body KB':>9} {'parse ms':>9} {'peak KB':>9}")
+    for size in SIZES:
+        raw = make_png(size)
+        data_url = "data:image/png;base64," + base64.b64encode(raw).decode()
+        json_body = json.dumps({"image": data_url, "dict_of_vars": {}, "mode": "basic"}).encode()
+        for label, fn, body in (("json", parse_json, json_body), ("raw", parse_raw, raw)):
+            elapsed, peak = measure(fn, body)
+            print(f"{size[0]:>5}x{size[1]:<4} {label:>5} {len(body) / 1024:>9.0f} "
+                  f"{elapsed * 1000:>9.2f} {peak / 1024:>9.0f}")
+
+
+if __name__ == '__main__':
+    main()
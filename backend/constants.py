@@ -2,8 +2,86 @@ from dotenv import load_dotenv
 import os
 load_dotenv()
 
-SERVER_URL = 'localhost'
-PORT = '8900'
-ENV = 'dev'
+SERVER_URL = os.getenv("SERVER_URL", "localhost")
+PORT = os.getenv("PORT", "8900")
+ENV = os.getenv("ENV", "dev")
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
\ No newline at end of file
+# Server processes when ENV is not dev; each has its own pools and limits
+WORKERS = int(os.getenv("WORKERS", "1"))
+
+# Check the model connection during startup, before traffic is accepted
+WARMUP_MODEL = os.getenv("WARMUP_MODEL", "true").lower() == "true"
+
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+
+# Concurrency limits for blocking work in the calculate route
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "4"))
+MODEL_CONCURRENCY = int(os.getenv("MODEL_CONCURRENCY", "8"))
+
+# Result cache for analyze_image; set RESULT_CACHE_PATH to persist it on disk.
+# With several workers it defaults to a SQLite file they all share, kept in
+# the app's own directory rather than a world-writable temp dir
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", "86400"))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH") or (
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "calculator-results.sqlite3") if WORKERS > 1 else None
+)
+RESULT_CACHE_PERCEPTUAL = os.getenv("RESULT_CACHE_PERCEPTUAL", "false").lower() == "true"
+
+# Model client pool; MODEL_BACKEND=fake swaps Gemini for a local stub
+MODEL_NAME = os.getenv("MODEL_NAME", "gemini-1.5-flash")
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "gemini")
+MODEL_POOL_SIZE = int(os.getenv("MODEL_POOL_SIZE", "2"))
+MODEL_CLIENT_CONCURRENCY = int(os.getenv("MODEL_CLIENT_CONCURRENCY", "4"))
+
+# Ask the model for JSON matching a response schema instead of a Python literal
+MODEL_STRUCTURED_OUTPUT = os.getenv("MODEL_STRUCTURED_OUTPUT", "false").lower() == "true"
+
+# Admission control in front of the model: the concurrency limit adapts
+# between ADMISSION_MIN_CONCURRENCY and MODEL_CONCURRENCY, at most
+# ADMISSION_QUEUE_SIZE callers wait, each for at most ADMISSION_MAX_WAIT seconds
+ADMISSION_MIN_CONCURRENCY = int(os.getenv("ADMISSION_MIN_CONCURRENCY", "1"))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "64"))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "10"))
+ADMISSION_LATENCY_TOLERANCE = float(os.getenv("ADMISSION_LATENCY_TOLERANCE", "2.0"))
+
+# Per-client token bucket over model calls: sustained calls per second and
+# burst size; 0 disables it. Cache hits and coalesced requests are free
+CLIENT_RATE = float(os.getenv("CLIENT_RATE", "2"))
+CLIENT_BURST = float(os.getenv("CLIENT_BURST", "20"))
+
+# Comma-separated proxy addresses whose X-Client-ID header identifies the
+# client; requests from anywhere else are charged to their peer address
+TRUSTED_PROXIES = {host.strip() for host in os.getenv("TRUSTED_PROXIES", "").split(",") if host.strip()}
+
+# Retries of model calls the upstream throttled, with jittered exponential backoff
+MODEL_RETRIES = int(os.getenv("MODEL_RETRIES", "3"))
+MODEL_RETRY_BASE_DELAY = float(os.getenv("MODEL_RETRY_BASE_DELAY", "0.5"))
+MODEL_RETRY_MAX_DELAY = float(os.getenv("MODEL_RETRY_MAX_DELAY", "8"))
+
+# Level for application logs; DEBUG adds per-stage timings and full model replies
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+
+# Split canvases holding several separate problems and solve each region on
+# its own; canvases that split into more regions than this are solved whole.
+# Off by default until the gap rules are tuned on real canvases
+CANVAS_SEGMENTATION = os.getenv("CANVAS_SEGMENTATION", "false").lower() == "true"
+SEGMENT_MAX_REGIONS = int(os.getenv("SEGMENT_MAX_REGIONS", "8"))
+
+# Batch endpoint limits
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "64"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+# Largest raw image accepted by POST /calculate/upload
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+
+# Largest decoded canvas, in pixels; checked from the header before decoding,
+# since a few KB of compressed image can expand to gigabytes
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", str(4096 * 4096)))
+
+# Optional JSON data file that replaces the built-in formula library
+FORMULA_LIBRARY_PATH = os.getenv("FORMULA_LIBRARY_PATH")
+
+# How many formulas, and roughly how many prompt tokens of them, go into each prompt
+FORMULA_TOP_K = int(os.getenv("FORMULA_TOP_K", "8"))
+FORMULA_TOKEN_BUDGET = int(os.getenv("FORMULA_TOKEN_BUDGET", "800"))
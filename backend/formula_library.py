@@ -2,6 +2,14 @@
 Formula reference library for different branches of mathematics
 """
 
+import bisect
+import heapq
+import json
+import re
+from collections import defaultdict
+
+from constants import FORMULA_LIBRARY_PATH
+
 # Basic Arithmetic
 BASIC_FORMULAS = {
     "pemdas": {
@@ -121,13 +129,168 @@ MODE_TO_FORMULAS = {
     "statistics": STATISTICS_FORMULAS
 }
 
+def load_formulas(path: str) -> dict:
+    """
+    Load a formula library from a JSON data file shaped like MODE_TO_FORMULAS:
+    {"<mode>": {"<key>": {"name": ..., "formula": ..., "explanation": ..., "aliases": [...]}}}
+    """
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    for mode, formulas in data.items():
+        for key, formula in formulas.items():
+            missing = {"name", "formula", "explanation"} - set(formula)
+            if missing:
+                raise ValueError(f"Formula '{mode}/{key}' in {path} is missing {sorted(missing)}")
+    return data
+
+
+if FORMULA_LIBRARY_PATH:
+    MODE_TO_FORMULAS = load_formulas(FORMULA_LIBRARY_PATH)
+
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+# Scores for the different ways a query word can match a formula
+NAME_EXACT_SCORE = 10.0
+NAME_PREFIX_SCORE = 6.0
+TEXT_EXACT_SCORE = 2.0
+TEXT_PREFIX_SCORE = 1.0
+FUZZY_MIN_SIMILARITY = 0.35
+MIN_PREFIX_LENGTH = 3
+
+
+def normalize(text: str) -> str:
+    """Lowercase and reduce to space-separated words: 'Pythagorean_Theorem' -> 'pythagorean theorem'"""
+    return " ".join(_WORD.findall(text.lower().replace("_", " ")))
+
+
+def _trigrams(word: str) -> set:
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class FormulaIndex:
+    """
+    Search structures built once over the library:
+    - an exact map from normalized keys, names and aliases
+    - inverted word indexes over names and explanations, with a sorted
+      vocabulary so prefixes ("pythag") resolve with a binary search
+    - a trigram index over name words for misspelled queries
+    - pre-serialized /formulas/by-mode response bodies
+    """
+
+    def __init__(self, mode_to_formulas: dict):
+        self.entries = []
+        self.by_name = {}
+        self.name_postings = defaultdict(set)
+        self.text_postings = defaultdict(set)
+        self.trigram_postings = defaultdict(set)
+        self.mode_bodies = {}
+
+        for mode, formulas in mode_to_formulas.items():
+            public = []
+            for key, data in formulas.items():
+                entry_id = len(self.entries)
+                self.entries.append((mode, key, data))
+                public.append({"name": data["name"], "formula": data["formula"], "explanation": data["explanation"]})
+
+                names = [key, data["name"], *data.get("aliases", [])]
+                for name in names:
+                    self.by_name.setdefault(normalize(name), entry_id)
+                for name in names:
+                    for word in normalize(name).split():
+                        self.name_postings[word].add(entry_id)
+                for word in normalize(data["explanation"]).split():
+                    self.text_postings[word].add(entry_id)
+            self.mode_bodies[mode] = json.dumps({"mode": mode, "formulas": public}, ensure_ascii=False).encode("utf-8")
+
+        for word in self.name_postings:
+            for gram in _trigrams(word):
+                self.trigram_postings[gram].add(word)
+        self.name_vocab = sorted(self.name_postings)
+        self.text_vocab = sorted(self.text_postings)
+
+    @staticmethod
+    def _prefixed(vocab: list, prefix: str):
+        start = bisect.bisect_left(vocab, prefix)
+        for word in vocab[start:]:
+            if not word.startswith(prefix):
+                break
+            yield word
+
+    def _fuzzy_words(self, word: str):
+        """Name words whose trigram similarity to word clears the threshold"""
+        grams = _trigrams(word)
+        overlap = defaultdict(int)
+        for gram in grams:
+            for candidate in self.trigram_postings.get(gram, ()):
+                overlap[candidate] += 1
+        for candidate, shared in overlap.items():
+            similarity = shared / len(grams | _trigrams(candidate))
+            if similarity >= FUZZY_MIN_SIMILARITY:
+                yield candidate, similarity
+
+    def lookup(self, name: str):
+        """Exact match on a key, display name or alias"""
+        entry_id = self.by_name.get(normalize(name))
+        return None if entry_id is None else self.entries[entry_id][2]
+
+    def search(self, query: str, limit: int = 10, mode: str = None) -> list:
+        """Rank formulas for a free-text query; returns (score, mode, key, formula) tuples"""
+        words = normalize(query).split()
+        if not words:
+            return []
+        scores = defaultdict(float)
+        exact = self.by_name.get(" ".join(words))
+        if exact is not None:
+            scores[exact] += NAME_EXACT_SCORE * len(words)
+
+        for word in words:
+            matched = False
+            for entry_id in self.name_postings.get(word, ()):
+                scores[entry_id] += NAME_EXACT_SCORE
+                matched = True
+            for entry_id in self.text_postings.get(word, ()):
+                scores[entry_id] += TEXT_EXACT_SCORE
+            if len(word) >= MIN_PREFIX_LENGTH:
+                for vocab_word in self._prefixed(self.name_vocab, word):
+                    if vocab_word != word:
+                        for entry_id in self.name_postings[vocab_word]:
+                            scores[entry_id] += NAME_PREFIX_SCORE * len(word) / len(vocab_word)
+                            matched = True
+                for vocab_word in self._prefixed(self.text_vocab, word):
+                    if vocab_word != word:
+                        for entry_id in self.text_postings[vocab_word]:
+                            scores[entry_id] += TEXT_PREFIX_SCORE
+            if not matched and len(word) >= MIN_PREFIX_LENGTH:
+                for vocab_word, similarity in self._fuzzy_words(word):
+                    for entry_id in self.name_postings[vocab_word]:
+                        scores[entry_id] += NAME_PREFIX_SCORE * similarity
+
+        if mode is not None:
+            scores = {entry_id: score for entry_id, score in scores.items() if self.entries[entry_id][0] == mode}
+        best = heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], self.entries[item[0]][1]))
+        return [(score, *self.entries[entry_id]) for entry_id, score in best]
+
+    def mode_body(self, mode: str) -> bytes:
+        """JSON body for /formulas/by-mode/{mode}, serialized once"""
+        body = self.mode_bodies.get(mode)
+        if body is None:
+            body = json.dumps({"mode": mode, "formulas": []}).encode("utf-8")
+        return body
+
+
+formula_index = FormulaIndex(MODE_TO_FORMULAS)
+
+
 def get_formulas_for_mode(mode: str):
     """Return formulas for the specified math mode"""
     return MODE_TO_FORMULAS.get(mode, {})
 
 def get_formula_by_name(name: str):
-    """Search for a formula by name across all modes"""
-    for formulas in MODE_TO_FORMULAS.values():
-        if name in formulas:
-            return formulas[name]
-    return None
+    """Look up a formula by its key, display name or alias across all modes"""
+    return formula_index.lookup(name)
+
+def search_formulas(query: str, limit: int = 10, mode: str = None):
+    """Ranked prefix/fuzzy search over formula names and explanations"""
+    return formula_index.search(query, limit=limit, mode=mode)
@@ -1,14 +1,30 @@
+import asyncio
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 import uvicorn
 from apps.calculator.route import router as calculator_router
 from apps.formulas.route import router as formulas_router
-from constants import SERVER_URL, PORT, ENV
+from apps.calculator.workers import shutdown_workers
+from apps.calculator.model import start_model_pool, stop_model_pool
+from apps.calculator.admission import Overloaded
+from apps.calculator.warmup import warm_up
+from constants import SERVER_URL, PORT, ENV, WORKERS
+from observability import RequestContextMiddleware, registry, setup_logging, stop_logging
+
+setup_logging()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    start_model_pool()
+    # Uvicorn starts serving only once the lifespan has yielded
+    await asyncio.to_thread(warm_up)
     yield
+    # Let in-flight model calls finish without blocking the event loop
+    await asyncio.to_thread(stop_model_pool)
+    shutdown_workers()
+    stop_logging()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -19,16 +35,37 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID", "Retry-After"],
 )
+app.add_middleware(RequestContextMiddleware)
+
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 
 @app.get('/')
 async def root():
     return {"message": "Server is running"}
 
+@app.get('/metrics', response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of stage latencies and solver counters"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 app.include_router(calculator_router, prefix="/calculate", tags=["calculate"])
 app.include_router(formulas_router, prefix="/formulas", tags=["formulas"])
 
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host=SERVER_URL, port=int(PORT), reload=(ENV == "dev"))
\ No newline at end of file
+    if ENV == "dev":
+        uvicorn.run("main:app", host=SERVER_URL, port=int(PORT), reload=True)
+    else:
+        # Each worker is a separate process with its own pools, limits and
+        # metrics; they share only the SQLite result cache
+        uvicorn.run("main:app", host=SERVER_URL, port=int(PORT), workers=WORKERS)
\ No newline at end of file
@@ -0,0 +1,210 @@
+"""
+Logging, request IDs and Prometheus-style metrics
+
+Log records are handed to a queue and written by a background thread, so
+request handlers never block on stderr. Every record carries the ID of
+the request it belongs to. Pipeline stages are timed with span() into
+histograms that GET /metrics renders in the Prometheus text format.
+"""
+
+import bisect
+import contextvars
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Iterable
+
+from constants import LOG_LEVEL
+
+request_id_var = contextvars.ContextVar("request_id", default="-")
+
+REQUEST_ID_HEADER = "x-request-id"
+
+_listener = None
+
+
+class _RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+def setup_logging(level: str = LOG_LEVEL):
+    """Route all logging through a queue drained by a background thread; safe to call twice"""
+    global _listener
+    if _listener is not None:
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(process)d %(levelname)s [%(request_id)s] %(name)s: %(message)s"))
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    # The request ID must be read on the calling thread, before the record is queued
+    queue_handler.addFilter(_RequestIdFilter())
+    root = logging.getLogger()
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper())
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names: Iterable[str], values: Iterable) -> str:
+    pairs = [f'{name}="{str(value)}"'.replace("\n", " ") for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def totals(self) -> dict:
+        """(count, sum) per label-value tuple, for callers that diff snapshots"""
+        with self._lock:
+            return {key: (count, total) for key, (_, total, count) in self._series.items()}
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        for key, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _format_labels(self.label_names + ("le",), key + (le,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    """Histograms owned here, plus collectors that report other components' counters at scrape time"""
+
+    def __init__(self):
+        self._histograms = []
+        self._collectors = []
+
+    def histogram(self, name: str, documentation: str, label_names=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        histogram = Histogram(name, documentation, label_names, buckets)
+        self._histograms.append(histogram)
+        return histogram
+
+    def register_collector(self, collector: Callable[[], list]):
+        """collector() returns (name, type, documentation, [(labels_dict, value), ...]) tuples"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for histogram in self._histograms:
+            lines.extend(histogram.render())
+        for collector in self._collectors:
+            for name, kind, documentation, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram(
+    "solve_stage_seconds", "Time spent in each stage of the solve pipeline", ["stage"])
+REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency, to the end of the response body", ["method", "route", "status"])
+NORMALIZE_BYTES_SAVED = registry.histogram(
+    "normalize_bytes_saved", "Bytes removed from each canvas by normalization, before it is sent to the model",
+    buckets=(0, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216))
+PROMPT_TOKENS = registry.histogram(
+    "prompt_tokens", "Estimated tokens in each rendered prompt, at four characters per token", ["mode"],
+    buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000))
+
+_logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def span(stage: str):
+    """Time a pipeline stage into solve_stage_seconds"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        _logger.debug("%s took %.1f ms", stage, elapsed * 1000)
+
+
+class RequestContextMiddleware:
+    """
+    Assigns each request an ID (honouring an incoming X-Request-ID), echoes
+    it on the response and records the request's latency.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        request_id = None
+        for name, value in scope.get("headers", ()):
+            if name == REQUEST_ID_HEADER.encode():
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex[:16]
+        token = request_id_var.set(request_id)
+        status = [500]
+        start = time.perf_counter()
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(REQUEST_ID_HEADER.encode(), request_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            route = scope.get("route")
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                # The route template keeps label cardinality bounded
+                route=getattr(route, "path", "unmatched"),
+                status=status[0],
+            )
+            request_id_var.reset(token)
@@ -26,3 +26,7 @@ class MathSolution(BaseModel):
     steps: Optional[List[str]] = None
     assign: bool = False
     formulas_used: Optional[List[FormulaInfo]] = None
+
+class BatchImageData(BaseModel):
+    items: List[ImageData]
+    stream: bool = False
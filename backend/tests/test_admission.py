@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from apps.calculator.admission import (AdaptiveLimiter, AdmissionController, ClientRateLimiter, Overloaded,
+                                       RateLimited, UpstreamThrottled)
+
+
+def test_client_bucket_allows_burst_then_rejects():
+    limiter = ClientRateLimiter(rate=0.001, burst=3)
+    for _ in range(3):
+        limiter.admit("a")
+    with pytest.raises(RateLimited) as error:
+        limiter.admit("a")
+    assert error.value.status_code == 429 and error.value.retry_after >= 1
+    # Other clients have their own bucket
+    limiter.admit("b")
+
+
+def test_batch_cost_is_capped_at_burst():
+    limiter = ClientRateLimiter(rate=0.001, burst=20)
+    limiter.admit("a", cost=40)
+    with pytest.raises(RateLimited):
+        limiter.admit("a")
+
+
+def test_zero_rate_disables_client_limit():
+    limiter = ClientRateLimiter(rate=0, burst=1)
+    for _ in range(10):
+        limiter.admit("a")
+
+
+def _complete(limiter, latency, count):
+    for _ in range(count):
+        limiter.in_flight += 1
+        limiter.release(latency)
+
+
+def test_limit_grows_by_one_per_window_at_steady_latency():
+    limiter = AdaptiveLimiter(initial=4, min_limit=1, max_limit=8)
+    _complete(limiter, 0.5, 4)
+    assert limiter.limit == 5
+    _complete(limiter, 0.5, 5)
+    assert limiter.limit == 6
+
+
+def test_single_slow_sample_does_not_cut_the_limit():
+    limiter = AdaptiveLimiter(initial=8, min_limit=1, max_limit=8)
+    _complete(limiter, 0.5, 50)
+    _complete(limiter, 3.0, 1)
+    _complete(limiter, 0.5, 7)
+    assert limiter.limit == 8
+
+
+def test_sustained_latency_rise_cuts_the_limit():
+    limiter = AdaptiveLimiter(initial=8, min_limit=1, max_limit=8)
+    _complete(limiter, 0.5, 50)
+    _complete(limiter, 5.0, 16)
+    assert limiter.limit < 8
+
+
+def test_throttling_halves_the_limit_at_once():
+    limiter = AdaptiveLimiter(initial=8, min_limit=1, max_limit=8)
+    limiter.in_flight += 1
+    limiter.release(throttled=True)
+    assert limiter.limit == 4 and limiter.throttled == 1
+
+
+def test_queue_full_is_rejected():
+    async def run():
+        limiter = AdaptiveLimiter(initial=1, min_limit=1, max_limit=1, queue_size=0)
+        await limiter.acquire()
+        with pytest.raises(Overloaded):
+            await limiter.acquire()
+        assert limiter.rejected == 1
+
+    asyncio.run(run())
+
+
+def test_release_when_done_holds_the_slot_until_the_future_finishes():
+    async def run():
+        limiter = AdaptiveLimiter(initial=2, min_limit=1, max_limit=2)
+        await limiter.acquire()
+        future = asyncio.get_running_loop().create_future()
+        limiter.release_when_done(future)
+        await asyncio.sleep(0)
+        assert limiter.in_flight == 1
+        future.set_exception(UpstreamThrottled("429"))
+        await asyncio.sleep(0)
+        assert limiter.in_flight == 0
+        assert limiter.throttled == 1
+
+    asyncio.run(run())
+
+
+def test_controller_retries_throttled_calls():
+    async def run():
+        controller = AdmissionController(AdaptiveLimiter(initial=2, min_limit=1, max_limit=2),
+                                         ClientRateLimiter(rate=0), retries=2, base_delay=0, max_delay=0)
+        attempts = []
+
+        async def call():
+            attempts.append(1)
+            if len(attempts) < 2:
+                raise UpstreamThrottled("429")
+            return "ok"
+
+        assert await controller.call(call) == "ok"
+        assert controller.retried == 1 and controller.limiter.in_flight == 0
+
+    asyncio.run(run())
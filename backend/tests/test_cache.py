@@ -0,0 +1,44 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from apps.calculator.cache import ResultCache
+
+ANSWER = [{"expr": "1 + 1", "result": 2, "assign": False}]
+
+
+def test_disk_tier_survives_a_new_process(tmp_path):
+    path = str(tmp_path / "results.sqlite3")
+    ResultCache(ttl=60, max_bytes=1 << 20, path=path).set("k", ANSWER)
+    cache = ResultCache(ttl=60, max_bytes=1 << 20, path=path)
+    assert cache.get("k") == ANSWER
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_failing_disk_lookup_is_a_miss(tmp_path):
+    cache = ResultCache(ttl=60, max_bytes=1 << 20, path=str(tmp_path / "results.sqlite3"))
+    cache._disk._conn.execute("DROP TABLE results")
+    assert cache.get("k") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_failing_disk_write_keeps_the_memory_copy(tmp_path):
+    cache = ResultCache(ttl=60, max_bytes=1 << 20, path=str(tmp_path / "results.sqlite3"))
+    cache._disk._conn.execute("DROP TABLE results")
+    cache.set("k", ANSWER)
+    assert cache.get("k") == ANSWER
+
+
+def test_counters_are_exact_under_threads():
+    cache = ResultCache(ttl=60, max_bytes=1 << 20, path=None)
+    cache.set("hit", ANSWER)
+    keys = ["hit", "miss"] * 2000
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(cache.get, keys))
+    stats = cache.stats()
+    assert stats["hits"] == 2000 and stats["misses"] == 2000
+
+
+def test_unopenable_file_falls_back_to_memory(tmp_path):
+    cache = ResultCache(ttl=60, max_bytes=1 << 20, path=str(tmp_path / "missing" / "results.sqlite3"))
+    assert cache.stats()["persistent"] is False
+    cache.set("k", ANSWER)
+    assert cache.get("k") == ANSWER
@@ -0,0 +1,56 @@
+from apps.calculator.local_solver import solve_locally
+
+
+def test_reevaluates_expression_over_changed_variable():
+    previous = [{"expr": "x + 2", "result": 5, "assign": False}]
+    assert solve_locally(previous, {"x": 3}, {"x": 10}) == [{"expr": "x + 2", "result": 12, "assign": False}]
+
+
+def test_substituted_expression_falls_back_to_model():
+    # The model wrote x's value into expr; x no longer appears in it
+    previous = [{"expr": "3 + 2", "result": 5, "assign": False}]
+    assert solve_locally(previous, {"x": 3}, {"x": 10}) is None
+
+
+def test_non_numeric_result_falls_back_to_model():
+    previous = [{"expr": "e", "result": "love", "assign": False}]
+    assert solve_locally(previous, {"x": 3}, {"x": 10}) is None
+
+
+def test_result_not_reproduced_under_previous_vars_falls_back_to_model():
+    previous = [{"expr": "x + 2", "result": 7, "assign": False}]
+    assert solve_locally(previous, {"x": 3}, {"x": 10}) is None
+
+
+def test_unchanged_variables_need_not_appear():
+    previous = [{"expr": "x * 4", "result": 12, "assign": False}]
+    answers = solve_locally(previous, {"x": 3, "y": 1}, {"x": 5, "y": 1})
+    assert answers == [{"expr": "x * 4", "result": 20, "assign": False}]
+
+
+def test_one_unreplayable_answer_sends_the_canvas_to_the_model():
+    previous = [
+        {"expr": "x + 2", "result": 5, "assign": False},
+        {"expr": "3 * 3", "result": 9, "assign": False},
+    ]
+    assert solve_locally(previous, {"x": 3}, {"x": 10}) is None
+
+
+def test_echoed_equation_is_resolved_with_new_variables():
+    previous = [{"expr": "x + a = 5", "result": 3, "assign": True}]
+    assert solve_locally(previous, {"a": 2}, {"a": 4}) == [{"expr": "x", "result": 1, "assign": True}]
+
+
+def test_echoed_equation_with_substituted_value_falls_back_to_model():
+    previous = [{"expr": "x + 2 = 5", "result": 3, "assign": True}]
+    assert solve_locally(previous, {"a": 2}, {"a": 4}) is None
+
+
+def test_nested_power_is_rejected_before_it_is_computed():
+    previous = [{"expr": "(((9^{99})^{99})^{99})^{99} + x", "result": 1, "assign": False}]
+    assert solve_locally(previous, {"x": 3}, {"x": 10}) is None
+
+
+def test_result_beyond_float_range_falls_back_to_model():
+    previous = [{"expr": "x + 2", "result": 10 ** 400, "assign": False}]
+    assert solve_locally(previous, {"x": 3}, {"x": 10}) is None
@@ -0,0 +1,85 @@
+from PIL import Image, ImageDraw
+
+from apps.calculator.preprocess import FRAME_WIDTH
+from apps.calculator.segmentation import segment_canvas
+
+FONT_SIZE = 72
+
+
+def make_canvas(size=(1600, 1000), frame=True):
+    image = Image.new("RGB", size, "white")
+    if frame:
+        ImageDraw.Draw(image).rectangle((0, 0, size[0] - 1, size[1] - 1), outline="black", width=FRAME_WIDTH)
+    return image
+
+
+def write(image, position, text):
+    """Draw text and return the bbox of its ink"""
+    ink = Image.new("L", image.size, 0)
+    ImageDraw.Draw(ink).text(position, text, fill=255, font_size=FONT_SIZE)
+    image.paste("black", mask=ink)
+    return ink.getbbox()
+
+
+def write_below(image, bbox, gap, text):
+    """Draw text so its ink starts gap pixels below bbox"""
+    top = Image.new("L", image.size, 0)
+    ImageDraw.Draw(top).text((0, 0), text, fill=255, font_size=FONT_SIZE)
+    return write(image, (bbox[0], bbox[3] + gap - top.getbbox()[1]), text)
+
+
+def contains(outer, inner):
+    return outer[0] <= inner[0] and outer[1] <= inner[1] and outer[2] >= inner[2] and outer[3] >= inner[3]
+
+
+def test_system_of_equations_with_wide_line_gap_stays_one_region():
+    image = make_canvas()
+    first = write(image, (200, 200), "2x + y = 7")
+    write_below(image, first, 90, "x - y = 2")
+    assert segment_canvas(image, 8) == []
+
+
+def test_assignment_stays_with_the_expression_below_it():
+    image = make_canvas()
+    assignment = write(image, (200, 200), "x = 4")
+    write_below(image, assignment, 40, "x^2 + 3x")
+    assert segment_canvas(image, 8) == []
+
+
+def test_assignment_stays_with_the_expression_beside_it():
+    image = make_canvas()
+    assignment = write(image, (200, 200), "x = 4,")
+    write(image, (assignment[2] + 60, 200), "2x + 1")
+    assert segment_canvas(image, 8) == []
+
+
+def test_selection_frame_does_not_join_separate_problems():
+    # Odd sizes leave a partial block at the far edges of the reduced copy
+    image = make_canvas(size=(1281, 721))
+    first = write(image, (150, 150), "12 + 7")
+    second = write(image, (900, 500), "81 / 9")
+    regions = segment_canvas(image, 8)
+    assert len(regions) == 2
+    assert contains(regions[0].bbox, first) and contains(regions[1].bbox, second)
+
+
+def test_separate_problems_split_in_reading_order():
+    image = make_canvas(size=(1921, 1081))
+    problems = [((150, 150), "12 + 7"), ((1200, 150), "3 * 4 - 5"), ((150, 750), "81 / 9"), ((1200, 750), "2^5")]
+    drawn = [write(image, position, text) for position, text in problems]
+    regions = segment_canvas(image, 8)
+    assert len(regions) == 4
+    for region, bbox in zip(regions, drawn):
+        assert contains(region.bbox, bbox)
+        # The frame around the selection is not part of any region
+        assert region.bbox[0] > FRAME_WIDTH and region.bbox[1] > FRAME_WIDTH
+        assert region.bbox[2] < image.width - FRAME_WIDTH and region.bbox[3] < image.height - FRAME_WIDTH
+
+
+def test_too_many_regions_solves_the_canvas_whole():
+    image = make_canvas()
+    for x in (150, 850):
+        for y in (150, 650):
+            write(image, (x, y), "1 + 1")
+    assert len(segment_canvas(image, 4)) == 4
+    assert segment_canvas(image, 3) == []
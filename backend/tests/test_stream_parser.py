@@ -0,0 +1,33 @@
+from apps.calculator.stream_parser import IncrementalResultParser
+
+
+def test_python_literal_results_and_steps_are_reported_as_they_close():
+    parser = IncrementalResultParser()
+    events = parser.feed("[{'expr': '1 + 1', 'result': 2, 'steps': ['add'")
+    assert events == [("step", 0, "add")]
+    events = parser.feed("]}, {'expr': 'x', 'result': 3, 'assign': True}]")
+    assert events == [
+        ("result", 0, {"expr": "1 + 1", "result": 2, "steps": ["add"]}),
+        ("result", 1, {"expr": "x", "result": 3, "assign": True}),
+    ]
+
+
+def test_json_results_are_parsed():
+    parser = IncrementalResultParser()
+    events = parser.feed('[{"expr": "x", "result": "3", "assign": true, "steps": ["x = 3"], "note": null}]')
+    assert events == [
+        ("step", 0, "x = 3"),
+        ("result", 0, {"expr": "x", "result": "3", "assign": True, "steps": ["x = 3"], "note": None}),
+    ]
+
+
+def test_json_escapes_in_steps_are_decoded():
+    parser = IncrementalResultParser()
+    events = parser.feed('[{"expr": "x", "result": "4", "steps": ["x\\u00b2 = 16"]}]')
+    assert events[0] == ("step", 0, "x² = 16")
+
+
+def test_unparseable_result_is_skipped_but_counted():
+    parser = IncrementalResultParser()
+    events = parser.feed("[{'expr': oops}, {'expr': '2', 'result': 2}]")
+    assert events == [("result", 1, {"expr": "2", "result": 2})]